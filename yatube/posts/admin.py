@@ -1,5 +1,6 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
+from . import search
 from .models import Post, Group, Comment, Follow
 
 
@@ -9,6 +10,22 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    # The best matches only: they are passed to the changelist as ids.
+    search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        post_ids = search.post_ids(search_term, self.search_limit + 1)
+        if len(post_ids) > self.search_limit:
+            post_ids = post_ids[:self.search_limit]
+            messages.warning(
+                request,
+                "Показаны %s лучших совпадений, уточните запрос."
+                % self.search_limit,
+            )
+        return queryset.filter(pk__in=post_ids), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "slug", "description")
@@ -0,0 +1,208 @@
+"""Read-only JSON API for the feeds.
+
+Rows are read with .values() and serialized as they come, without
+building model instances. Each response carries a weak ETag built from
+a light read of the page: ids, versions and comment counts of the rows
+on it, plus the cursor. A client revalidating an unchanged page gets an
+empty 304 before the full rows are read or serialized. There is no
+Last-Modified: no row records when it was last changed, and edits,
+counters or deletions would not move a date taken from the rows shown.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, quote_etag,
+)
+from django.views.decorators.http import require_safe
+
+from . import counters, notifications, timeline, trending
+from .models import Comment, Group, Post, User
+from .pagination import CursorPaginator
+
+PER_PAGE = 10
+KEY_FIELDS = ("id", "pub_date", "version", "comment_count")
+
+
+def serialize_post(row):
+    row["image"] = default_storage.url(row["image"]) if row["image"] else None
+    return row
+
+
+def post_rows(page):
+    """The API rows for a page of KEY_FIELDS rows, in page order."""
+    posts = {
+        row["id"]: row
+        for row in Post.objects.for_api().filter(
+            pk__in=[row["id"] for row in page]
+        ).order_by()
+    }
+    return [
+        serialize_post(posts[row["id"]])
+        for row in page if row["id"] in posts
+    ]
+
+
+def page_data(page):
+    return {
+        "results": post_rows(page),
+        "next": page.next_cursor,
+        "previous": page.previous_cursor,
+    }
+
+
+def json_response(request, key, build):
+    """Answer 304 if the page ``key`` is unchanged, else send ``build()``."""
+    data = [request.get_full_path(), key]
+    etag = "W/" + quote_etag(hashlib.md5(
+        json.dumps(data, cls=DjangoJSONEncoder).encode()
+    ).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        body = json.dumps(build(), cls=DjangoJSONEncoder, ensure_ascii=False)
+        response = HttpResponse(body.encode(), content_type="application/json")
+    response["ETag"] = etag
+    return response
+
+
+def feed_response(request, posts, extra=None):
+    paginator = CursorPaginator(posts.values(*KEY_FIELDS), PER_PAGE)
+    page = paginator.get_page(request.GET.get("cursor"))
+    return json_response(
+        request, [extra, list(page)],
+        lambda: dict(extra or {}, **page_data(page)),
+    )
+
+
+@require_safe
+def index(request):
+    return feed_response(request, Post.objects.all())
+
+
+@require_safe
+def group_posts(request, slug):
+    group = get_object_or_404(
+        Group.objects.values("id", "title", "slug", "description"),
+        slug=slug,
+    )
+    posts = Post.objects.filter(group_id=group["id"])
+    return feed_response(request, posts, {"group": group})
+
+
+@require_safe
+def profile(request, username):
+    author = get_object_or_404(
+        User.objects.values(
+            "id", "username", "first_name", "last_name",
+            posts_count=F("stats__posts_count"),
+            followers_count=F("stats__followers_count"),
+            following_count=F("stats__following_count"),
+        ),
+        username=username,
+    )
+    if author["posts_count"] is None:
+        stats = counters.user_stats(User.objects.get(pk=author["id"]))
+        for name in ("posts_count", "followers_count", "following_count"):
+            author[name] = getattr(stats, name)
+    posts = Post.objects.filter(author_id=author["id"])
+    return feed_response(request, posts, {"author": author})
+
+
+@require_safe
+def post_view(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.values(*KEY_FIELDS),
+        author__username=username, id=post_id,
+    )
+    comments = comment_page(post_id, request.GET.get("cursor"))
+
+    def build():
+        return dict(
+            serialize_post(Post.objects.for_api().get(pk=post_id)),
+            comments=comment_rows(comments),
+            comments_next=comments.next_cursor,
+        )
+    return json_response(request, [post, list(comments)], build)
+
+
+def comment_page(post_id, cursor):
+    comments = Comment.objects.filter(post_id=post_id).values(
+        "id", "created"
+    )
+    paginator = CursorPaginator(
+        comments, settings.COMMENTS_PER_PAGE, ordering=("created", "id")
+    )
+    return paginator.get_page(cursor)
+
+
+def comment_rows(page):
+    comments = {
+        row["id"]: row
+        for row in Comment.objects.filter(
+            pk__in=[row["id"] for row in page]
+        ).values(
+            "id", "text", "created", author_username=F("author__username")
+        )
+    }
+    return [comments[row["id"]] for row in page if row["id"] in comments]
+
+
+@require_safe
+def post_comments(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.values("id"), author__username=username, id=post_id
+    )
+    comments = comment_page(post["id"], request.GET.get("cursor"))
+    return json_response(request, list(comments), lambda: {
+        "results": comment_rows(comments),
+        "next": comments.next_cursor,
+        "previous": comments.previous_cursor,
+    })
+
+
+def unauthorized():
+    return JsonResponse(
+        {"detail": "Authentication credentials were not provided."},
+        status=401,
+    )
+
+
+@require_safe
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return unauthorized()
+    posts = Post.objects.values(*KEY_FIELDS)
+    cursor = request.GET.get("cursor")
+    if settings.FOLLOW_TIMELINE_ENABLED:
+        page = timeline.get_page(request.user, cursor, PER_PAGE, posts)
+    else:
+        posts = posts.filter(author__following__user=request.user)
+        page = CursorPaginator(posts, PER_PAGE).get_page(cursor)
+    return json_response(
+        request, [request.user.pk, list(page)], lambda: page_data(page)
+    )
+
+
+@require_safe
+def popular(request):
+    page = trending.get_page(
+        request.GET.get("cursor"), PER_PAGE, Post.objects.values(*KEY_FIELDS)
+    )
+    return json_response(request, list(page), lambda: page_data(page))
+
+
+@require_safe
+def unread_notifications(request):
+    if not request.user.is_authenticated:
+        return unauthorized()
+    response = JsonResponse(
+        {"unread": notifications.unread_count(request.user.id)}
+    )
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,18 @@
+from django.urls import path
+
+from . import api
+
+app_name = "api"
+
+urlpatterns = [
+    path("posts/", api.index, name="index"),
+    path("group/<slug:slug>/", api.group_posts, name="group_posts"),
+    path("follow/", api.follow_index, name="follow_index"),
+    path("popular/", api.popular, name="popular"),
+    path("notifications/unread/", api.unread_notifications,
+         name="unread_notifications"),
+    path("<str:username>/", api.profile, name="profile"),
+    path("<str:username>/<int:post_id>/", api.post_view, name="post"),
+    path("<str:username>/<int:post_id>/comments/", api.post_comments,
+         name="post_comments"),
+]
@@ -0,0 +1,106 @@
+"""Conditional GET for the HTML pages.
+
+A page's ETag covers the rows it shows, their edits and counters, and
+the viewer. It is weak: forms on the page carry a CSRF token that
+differs between responses, so two 200s are equivalent but not
+byte-identical. Clients revalidating an unchanged page get a 304
+before the view or any template runs. No row records when it last
+changed, so the pages carry no Last-Modified.
+Anonymous pages may be kept by a shared cache for a short while; pages
+for logged-in users stay private.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+    quote_etag,
+)
+
+from .models import Comment, Group, Post, User
+from .pagination import CursorPaginator
+
+PER_PAGE = 10
+AUTHOR_FIELDS = (
+    "first_name", "last_name", "stats__posts_count",
+    "stats__followers_count", "stats__following_count",
+)
+
+
+def page_rows(request, queryset):
+    paginator = CursorPaginator(queryset, PER_PAGE)
+    queryset, _, _ = paginator.cursor_queryset(request.GET.get("cursor"))
+    return list(queryset.values_list(
+        "pub_date", "id", "version", "comment_count"
+    )[:PER_PAGE + 1])
+
+
+def group_state(request, slug):
+    group = Group.objects.filter(slug=slug).values_list(
+        "id", "title", "description"
+    ).first()
+    if group is None:
+        return None
+    rows = page_rows(request, Post.objects.filter(group_id=group[0]))
+    return [group, rows]
+
+
+def profile_state(request, username):
+    author = User.objects.filter(username=username).values_list(
+        "id", *AUTHOR_FIELDS
+    ).first()
+    if author is None:
+        return None
+    rows = page_rows(request, Post.objects.filter(author_id=author[0]))
+    return [author, rows]
+
+
+def post_state(request, username, post_id):
+    last_comment = Comment.objects.filter(post=OuterRef("pk")).order_by(
+        "-created"
+    ).values("created")[:1]
+    rows = Post.objects.filter(
+        id=post_id, author__username=username
+    ).annotate(last_comment=Subquery(last_comment)).values_list(
+        "last_comment", "comment_count", "version",
+        *("author__%s" % name for name in AUTHOR_FIELDS)
+    ).order_by()[:1]
+    for post in rows:
+        return post
+    return None
+
+
+def conditional_page(state_func):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            version = state_func(request, *args, **kwargs)
+            if version is None:
+                return view(request, *args, **kwargs)
+            data = [request.get_full_path(), request.user.pk, version]
+            etag = "W/" + quote_etag(hashlib.md5(
+                json.dumps(data, cls=DjangoJSONEncoder).encode()
+            ).hexdigest())
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            response["ETag"] = etag
+            patch_vary_headers(response, ("Cookie",))
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(
+                    response, public=True, max_age=0,
+                    s_maxage=settings.HTML_SHARED_MAX_AGE,
+                )
+            return response
+        return wrapper
+    return decorator
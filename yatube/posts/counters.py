@@ -0,0 +1,76 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from yatube.db import run_write
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _change(queryset, field, delta, **extra):
+    if delta < 0:
+        queryset = queryset.filter(**{"%s__gt" % field: 0})
+    return queryset.update(**{field: F(field) + delta}, **extra)
+
+
+def bump_version(post_id):
+    Post.objects.filter(pk=post_id).update(version=F("version") + 1)
+
+
+def change_comment_count(post_id, delta):
+    _change(
+        Post.objects.filter(pk=post_id), "comment_count", delta,
+        version=F("version") + 1,
+    )
+
+
+def change_user_count(user_id, field, delta):
+    queryset = UserStats.objects.filter(pk=user_id)
+    # A missing row is recounted when it is read. Filling it in on a
+    # decrement would also recreate it for a user being deleted.
+    if _change(queryset, field, delta) or delta < 0:
+        return
+    if not queryset.exists():
+        recount_users(User.objects.filter(pk=user_id))
+
+
+def user_stats(user):
+    """The user's counters, filled in first if the row is missing.
+
+    Users written with bulk_create, as generate_data and import_content
+    do, have no UserStats row until a recount. The new row is read back
+    from the primary; a replica may not have it yet.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        run_write(recount_users, User.objects.filter(pk=user.pk))
+        user.stats = UserStats.objects.using("default").get(pk=user.pk)
+        return user.stats
+
+
+def _count(model, field):
+    counts = model.objects.filter(**{field: OuterRef("pk")}).order_by()
+    counts = counts.values(field).annotate(count=Count("pk"))
+    return Coalesce(Subquery(counts.values("count")), 0)
+
+
+def recount_posts(posts=None):
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.update(comment_count=_count(Comment, "post"))
+
+
+def recount_users(users=None):
+    if users is None:
+        users = User.objects.all()
+    missing = users.filter(stats__isnull=True).values_list("pk", flat=True)
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id) for user_id in missing.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    return UserStats.objects.filter(user__in=users).update(
+        posts_count=_count(Post, "author"),
+        followers_count=_count(Follow, "author"),
+        following_count=_count(Follow, "user"),
+    )
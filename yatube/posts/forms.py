@@ -1,11 +1,69 @@
+from io import BytesIO
+
 from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
 from .models import Post, Comment
 
 
+class HeaderImageField(forms.ImageField):
+    """Image field that trusts the header and leaves decoding to a job."""
+
+    default_error_messages = {
+        "too_large": "Файл больше %(limit)s.",
+        "too_many_pixels": "Изображение больше %(limit)s пикселей.",
+    }
+
+    def to_python(self, data):
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+        max_pixels = settings.POST_IMAGE_MAX_PIXELS
+        if getattr(f, "size_exceeded", False) or (
+                f.size > settings.POST_IMAGE_MAX_BYTES):
+            raise ValidationError(
+                self.error_messages["too_large"], code="too_large",
+                params={"limit": filesizeformat(
+                    settings.POST_IMAGE_MAX_BYTES
+                )},
+            )
+        if getattr(f, "pixels_exceeded", False):
+            raise ValidationError(
+                self.error_messages["too_many_pixels"],
+                code="too_many_pixels", params={"limit": max_pixels},
+            )
+        if hasattr(data, "temporary_file_path"):
+            file = data.temporary_file_path()
+        elif hasattr(data, "read"):
+            file = BytesIO(data.read())
+        else:
+            file = BytesIO(data["content"])
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                f.content_type = Image.MIME.get(image.format)
+        except Exception as exc:
+            raise ValidationError(
+                self.error_messages["invalid_image"], code="invalid_image",
+            ) from exc
+        if width * height > max_pixels:
+            raise ValidationError(
+                self.error_messages["too_many_pixels"],
+                code="too_many_pixels", params={"limit": max_pixels},
+            )
+        if hasattr(f, "seek") and callable(f.seek):
+            f.seek(0)
+        return f
+
+
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('group', 'text', 'image')
+        field_classes = {'image': HeaderImageField}
 
 
 class CommentForm(forms.ModelForm):
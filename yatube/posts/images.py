@@ -0,0 +1,166 @@
+"""Image processing outside of the request/response cycle.
+
+Views queue a job after saving an image; the task worker strips the
+upload's metadata once, then renders the sorl thumbnail and the
+responsive variants and stores their urls on the post, so templates
+never have to open the image themselves.
+"""
+import hashlib
+import io
+import json
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models import F
+from PIL import Image, ImageOps
+from sorl.thumbnail import get_thumbnail
+
+from . import page_cache
+from .tasks import enqueue, task
+from .models import Post
+
+THUMBNAIL_GEOMETRY = "960x339"
+VARIANT_WIDTHS = (480, 960, 1440)
+VARIANT_RATIO = 339 / 960
+# Preferred formats first; the last one is the <img> fallback.
+VARIANT_FORMATS = (
+    ("AVIF", "avif", "image/avif"),
+    ("WEBP", "webp", "image/webp"),
+    ("JPEG", "jpg", "image/jpeg"),
+)
+
+
+def generate_thumbnail(post_id):
+    post = Post.objects.filter(pk=post_id).only("image").first()
+    if post is None:
+        return
+    fields = {"thumbnail": "", "thumbnail_width": None,
+              "thumbnail_height": None}
+    posts = Post.objects.filter(pk=post_id)
+    if post.image:
+        posts = posts.filter(image=post.image.name)
+        thumbnail = get_thumbnail(
+            post.image, THUMBNAIL_GEOMETRY, crop="center", upscale=True
+        )
+        fields = {
+            "thumbnail": thumbnail.url,
+            "thumbnail_width": thumbnail.width,
+            "thumbnail_height": thumbnail.height,
+        }
+    updated = posts.update(version=F("version") + 1, **fields)
+    if updated:
+        page_cache.bump_generation("index")
+
+
+def available_formats():
+    Image.init()
+    return [fmt for fmt in VARIANT_FORMATS if fmt[0] in Image.SAVE]
+
+
+def variant_directory(name):
+    digest = hashlib.md5(name.encode()).hexdigest()[:12]
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    return "variants/%s-%s" % (stem, digest)
+
+
+def build_variants(name):
+    directory = variant_directory(name)
+    formats = available_formats()
+    image = None
+    sources = []
+    for pil_format, extension, mime in formats:
+        srcset = []
+        for width in VARIANT_WIDTHS:
+            path = "%s/%s.%s" % (directory, width, extension)
+            if not default_storage.exists(path):
+                if image is None:
+                    with default_storage.open(name) as source:
+                        image = Image.open(source)
+                        image.load()
+                    image = ImageOps.exif_transpose(image).convert("RGB")
+                size = (width, round(width * VARIANT_RATIO))
+                variant = ImageOps.fit(image, size, Image.LANCZOS)
+                content = io.BytesIO()
+                variant.save(content, pil_format, quality=80)
+                default_storage.save(path, ContentFile(content.getvalue()))
+            srcset.append("%s %sw" % (default_storage.url(path), width))
+        sources.append({"type": mime, "srcset": ", ".join(srcset)})
+    return sources
+
+
+def generate_variants(post_id):
+    post = Post.objects.filter(pk=post_id).only("image").first()
+    if post is None:
+        return False
+    posts = Post.objects.filter(pk=post_id)
+    variants = ""
+    if post.image:
+        posts = posts.filter(image=post.image.name)
+        variants = json.dumps(build_variants(post.image.name))
+    updated = posts.update(
+        image_variants=variants, version=F("version") + 1
+    )
+    if updated:
+        page_cache.bump_generation("index")
+    return bool(updated)
+
+
+def sanitize_image(post_id):
+    post = Post.objects.filter(pk=post_id).only("image").first()
+    if post is None or not post.image:
+        return
+    name = post.image.name
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        # GIF palettes and animations do not survive a re-encode intact.
+        if image.format == "GIF":
+            return
+        image_format = image.format
+        image.load()
+    params = {"quality": 90}
+    if "transparency" in image.info:
+        params["transparency"] = image.info["transparency"]
+    image = ImageOps.exif_transpose(image)
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    content = io.BytesIO()
+    # Saving without exif/icc_profile/pnginfo drops the source metadata.
+    image.save(content, image_format, **params)
+    # The clean copy gets a new name and the post is switched over to it,
+    # so the upload stays in place until the copy is stored.
+    clean = default_storage.save(name, ContentFile(content.getvalue()))
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        image=clean, version=F("version") + 1
+    )
+    default_storage.delete(name if updated else clean)
+
+
+def process_image(post_id):
+    generate_thumbnail(post_id)
+    generate_variants(post_id)
+
+
+@task(priority=5)
+def process_upload(post_id):
+    # Only new uploads are re-encoded; rebuilding the variants later
+    # must not recompress the stored image again.
+    sanitize_image(post_id)
+    process_image(post_id)
+
+
+def run_in_worker(function, *args):
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+def schedule_processing(post_id):
+    if not settings.THUMBNAIL_ASYNC:
+        process_upload(post_id)
+        return
+    enqueue(process_upload, post_id, key="process_upload:%s" % post_id)
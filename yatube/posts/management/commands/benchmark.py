@@ -0,0 +1,196 @@
+import json
+import math
+import platform
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import urls
+from posts.models import Group, Post, User
+
+# Views that change data are not replayed.
+WRITE_VIEWS = {
+    "profile_follow", "profile_unfollow", "add_comment", "notifications_read",
+}
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every page in posts/urls.py through the test client and "
+        "report latency percentiles, queries and throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--cold", action="store_true",
+            help="Clear all caches before every request",
+        )
+        parser.add_argument("--views", nargs="*", help="Only these views")
+        parser.add_argument("--output", help="Save results to a JSON file")
+        parser.add_argument(
+            "--baseline", help="Compare with results saved by --output",
+        )
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help="Allowed p95 slowdown against the baseline (0.2 = 20%%)",
+        )
+
+    def handle(self, *args, **options):
+        targets = self.targets()
+        names = [pattern.name for pattern in urls.urlpatterns]
+        skipped = [name for name in names if name not in targets]
+        if options["views"]:
+            targets = {
+                name: target for name, target in targets.items()
+                if name in options["views"]
+            }
+        if skipped:
+            self.stdout.write("Skipping %s" % ", ".join(skipped))
+        overrides = {
+            "DEBUG": False,
+            "QUERY_INSPECTOR_ENABLED": False,
+            "ALLOWED_HOSTS": list(settings.ALLOWED_HOSTS) + ["testserver"],
+        }
+        with override_settings(**overrides):
+            views = {
+                name: self.measure(url, user, options)
+                for name, (url, user) in targets.items()
+            }
+        results = {
+            "created": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "requests": options["requests"],
+            "cold": options["cold"],
+            "dataset": {
+                "users": User.objects.count(),
+                "groups": Group.objects.count(),
+                "posts": Post.objects.count(),
+            },
+            "views": views,
+        }
+        self.report(views)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                self.compare(views, json.load(baseline)["views"],
+                             options["tolerance"])
+
+    def targets(self):
+        post = Post.objects.select_related("author").order_by(
+            "-comment_count", "pk"
+        ).first()
+        if post is None:
+            raise CommandError("No posts yet, run generate_data first")
+        author = post.author
+        reader = User.objects.filter(stats__isnull=False).order_by(
+            "-stats__following_count", "pk"
+        ).first()
+        targets = {
+            "index": (reverse("index"), None),
+            "new_post": (reverse("new_post"), author),
+            "search": (reverse("search") + "?q=" + post.text.split()[0],
+                       None),
+            "follow_index": (reverse("follow_index"), reader),
+            "notifications": (reverse("notifications"), reader),
+            "popular": (reverse("popular"), None),
+            "profile": (reverse("profile", args=[author.username]), None),
+            "post": (reverse("post", args=[author.username, post.id]), None),
+            "post_comments": (
+                reverse("post_comments", args=[author.username, post.id]),
+                None,
+            ),
+            "post_edit": (
+                reverse("post_edit", args=[author.username, post.id]), author
+            ),
+        }
+        group = Group.objects.order_by("pk").first()
+        if group is not None:
+            targets["group_posts"] = (
+                reverse("group_posts", args=[group.slug]), None
+            )
+        return targets
+
+    def clear_caches(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+    def measure(self, url, user, options):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        for _ in range(options["warmup"]):
+            client.get(url)
+        timings = []
+        queries = 0
+        started = time.perf_counter()
+        for _ in range(options["requests"]):
+            if options["cold"]:
+                self.clear_caches()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError("%s answered %s" % (
+                    url, response.status_code
+                ))
+            queries += len(captured)
+        elapsed = time.perf_counter() - started
+        return {
+            "url": url,
+            "p50_ms": percentile(timings, 50) * 1000,
+            "p95_ms": percentile(timings, 95) * 1000,
+            "p99_ms": percentile(timings, 99) * 1000,
+            "queries": queries / len(timings),
+            "rps": len(timings) / elapsed,
+        }
+
+    def report(self, views):
+        self.stdout.write("%-14s %9s %9s %9s %8s %8s" % (
+            "view", "p50 ms", "p95 ms", "p99 ms", "queries", "req/s"
+        ))
+        for name, view in views.items():
+            self.stdout.write("%-14s %9.2f %9.2f %9.2f %8.1f %8.1f" % (
+                name, view["p50_ms"], view["p95_ms"], view["p99_ms"],
+                view["queries"], view["rps"],
+            ))
+
+    def compare(self, views, baseline, tolerance):
+        regressions = []
+        for name, view in views.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            change = view["p95_ms"] / max(before["p95_ms"], 1e-6) - 1
+            self.stdout.write("%-14s p95 %+6.1f%%  queries %+.1f" % (
+                name, change * 100, view["queries"] - before["queries"]
+            ))
+            if change > tolerance:
+                regressions.append("%s p95 %.2f ms (was %.2f ms)" % (
+                    name, view["p95_ms"], before["p95_ms"]
+                ))
+            if view["queries"] > before["queries"]:
+                regressions.append("%s %.1f queries (was %.1f)" % (
+                    name, view["queries"], before["queries"]
+                ))
+        if regressions:
+            raise CommandError("Regressions: %s" % "; ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions"))
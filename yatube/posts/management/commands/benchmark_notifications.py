@@ -0,0 +1,80 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from posts import notifications
+from posts.management.commands.generate_data import BATCH_SIZE
+from posts.models import Follow, Notification, Post, User
+
+PREFIX = "fanout-bench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Time notification fan-out for one author with many followers; "
+        "everything is rolled back afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--followers", type=int, default=100000)
+        parser.add_argument(
+            "--batch-size", type=int, nargs="*", default=[1000],
+            help="NOTIFICATION_BATCH_SIZE values to compare",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.monotonic()
+            author, user_ids = self.create_followers(options["followers"])
+            self.stdout.write("%s followers created in %.1fs" % (
+                len(user_ids), time.monotonic() - started
+            ))
+            self.stdout.write("%10s %10s %10s %12s" % (
+                "batch", "rows", "seconds", "rows/s"
+            ))
+            # bulk_create skips the signals, so nothing is queued.
+            Post.objects.bulk_create([Post(author=author, text="benchmark")])
+            post = Post.objects.get(author=author)
+            for batch_size in options["batch_size"]:
+                Notification.objects.filter(post=post).delete()
+                with override_settings(NOTIFICATION_BATCH_SIZE=batch_size):
+                    started = time.monotonic()
+                    rows = notifications.fan_out(post.id)
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write("%10s %10s %10.2f %12.0f" % (
+                    batch_size, rows, elapsed, rows / elapsed
+                ))
+            self.report_unread(user_ids[0])
+            transaction.set_rollback(True)
+
+    def create_followers(self, count):
+        password = make_password(None)
+        author = User.objects.create(username=PREFIX, password=password)
+        User.objects.bulk_create(
+            (User(username="%s-%s" % (PREFIX, number), password=password)
+             for number in range(count)),
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = list(User.objects.filter(
+            username__startswith=PREFIX + "-"
+        ).values_list("pk", flat=True))
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author=author) for user_id in user_ids),
+            batch_size=BATCH_SIZE,
+        )
+        return author, user_ids
+
+    def report_unread(self, user_id):
+        cache.delete(notifications.UNREAD_KEY % user_id)
+        timings = []
+        for _ in range(2):
+            started = time.perf_counter()
+            notifications.unread_count(user_id)
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write("unread count: %.2f ms cold, %.2f ms cached" % (
+            timings[0], timings[1]
+        ))
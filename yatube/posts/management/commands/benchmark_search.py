@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Compare indexed search with an icontains scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("words", nargs="+")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def measure(self, function, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        self.stdout.write("Backend: %s, posts: %s" % (
+            search.get_backend().name, Post.objects.count()
+        ))
+        for word in options["words"]:
+            indexed = self.measure(
+                lambda: list(search.search(word)), repeat
+            )
+            scan = self.measure(
+                lambda: list(Post.objects.for_feed().filter(
+                    text__icontains=word
+                )[:10]),
+                repeat,
+            )
+            self.stdout.write(
+                "%-20s index %8.2f ms   icontains %8.2f ms   x%.1f" % (
+                    word, indexed, scan, scan / indexed if indexed else 0
+                )
+            )
@@ -0,0 +1,113 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context, Engine
+from django.template.backends.django import get_installed_libraries
+
+from posts.management.commands.benchmark import percentile
+from posts.models import Post
+
+# How the card template looked before {% post_cards %}: one include per
+# post, four {% url %} reversals in each.
+LEGACY_URLS = {
+    "{{ urls.profile }}": "{% url 'profile' post.author.username %}",
+    "{{ urls.group }}": "{% url 'group_posts' post.group.slug %}",
+    "{{ urls.post }}": "{% url 'post' post.author.username post.id %}",
+    "{{ urls.edit }}": "{% url 'post_edit' post.author.username post.id %}",
+}
+LEGACY_PAGE = (
+    "{% for post in posts %}"
+    '{% include "legacy/post_card.html" with post=post %}'
+    "{% endfor %}"
+)
+BATCH_PAGE = "{% load cards %}{% post_cards posts %}"
+
+
+def legacy_card(source):
+    source = source.replace("{% for post, urls in cards %}\n", "", 1)
+    source = source[:source.rindex("{% endfor %}")]
+    for new, old in LEGACY_URLS.items():
+        source = source.replace(new, old)
+    return source
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering a page of post cards: per-post includes with and "
+        "without the cached loader, and the batched {% post_cards %} tag"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="*", default=[10, 50, 200],
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--warm", action="store_true",
+            help="Keep card fragments cached between renders",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        source = self.engine(cached=False).get_template(
+            "includes/post_cards.html"
+        ).source
+        pages = {
+            "legacy/post_card.html": legacy_card(source),
+            "legacy/page.html": LEGACY_PAGE,
+            "batch/page.html": BATCH_PAGE,
+        }
+        modes = [
+            ("include", self.engine(False, pages), "legacy/page.html"),
+            ("cached", self.engine(True, pages), "legacy/page.html"),
+            ("batch", self.engine(True, pages), "batch/page.html"),
+        ]
+        self.stdout.write("%6s %12s %12s %12s %8s" % (
+            "posts", "include ms", "cached ms", "batch ms", "speedup"
+        ))
+        for size in options["sizes"]:
+            posts = list(
+                Post.objects.for_feed().order_by("-pub_date", "-id")[:size]
+            )
+            if len(posts) < size:
+                raise CommandError(
+                    "Only %s posts, run generate_data first" % len(posts)
+                )
+            timings = [
+                self.measure(engine, name, posts, options)
+                for _, engine, name in modes
+            ]
+            self.stdout.write("%6s %12.2f %12.2f %12.2f %7.1fx" % (
+                size, *timings, timings[0] / max(timings[-1], 1e-9)
+            ))
+
+    def engine(self, cached, pages=None):
+        loaders = [
+            "django.template.loaders.filesystem.Loader",
+            "django.template.loaders.app_directories.Loader",
+        ]
+        if pages:
+            loaders.insert(0, ("django.template.loaders.locmem.Loader", pages))
+        if cached:
+            loaders = [("django.template.loaders.cached.Loader", loaders)]
+        return Engine(
+            dirs=[settings.TEMPLATES_DIR], loaders=loaders,
+            libraries=get_installed_libraries(),
+        )
+
+    def measure(self, engine, name, posts, options):
+        context = {"posts": posts, "user": AnonymousUser()}
+        engine.get_template(name).render(Context(context))
+        timings = []
+        for _ in range(options["repeat"]):
+            if not options["warm"]:
+                caches["fragment"].clear()
+            start = time.perf_counter()
+            # Like render() in a view, the template is looked up each time.
+            engine.get_template(name).render(Context(context))
+            timings.append(time.perf_counter() - start)
+        return percentile(timings, 50) * 1000
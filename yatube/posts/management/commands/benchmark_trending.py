@@ -0,0 +1,83 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import trending
+from posts.management.commands.generate_data import BATCH_SIZE
+from posts.models import Post, PostScore, User
+
+PREFIX = "trending-bench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Time popular feed score updates, top-N lookups and compaction "
+        "over many scored posts; everything is rolled back afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--top", type=int, default=11)
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.monotonic()
+            post_ids = self.create_scores(options["posts"])
+            self.stdout.write("%s scores created in %.1fs" % (
+                len(post_ids), time.monotonic() - started
+            ))
+            repeat = options["repeat"]
+            now = timezone.now()
+            self.report("add", repeat, lambda: trending.add(
+                random.choice(post_ids), 1.0,
+                now + timedelta(seconds=random.random() * 3600),
+            ))
+            limit = options["top"]
+            self.report(
+                "top %s, uncached" % limit, repeat,
+                lambda: trending.ranked(limit),
+            )
+            cache.delete(trending.TOP_KEY % limit)
+            self.report(
+                "top %s, cached" % limit, repeat,
+                lambda: trending.top(limit),
+            )
+            cache.delete(trending.TOP_KEY % limit)
+            self.report("compact", 1, trending.compact)
+            transaction.set_rollback(True)
+
+    def create_scores(self, count):
+        author = User.objects.create(username=PREFIX)
+        # bulk_create skips the signals, so nothing else is written.
+        Post.objects.bulk_create(
+            (Post(author=author, text="benchmark") for _ in range(count)),
+            batch_size=BATCH_SIZE,
+        )
+        post_ids = list(
+            Post.objects.filter(author=author).values_list("pk", flat=True)
+        )
+        epoch = trending.current_epoch().started
+        PostScore.objects.bulk_create(
+            (PostScore(post_id=post_id, score=random.expovariate(1) * 2 ** (
+                trending.half_lives(epoch, timezone.now())
+            )) for post_id in post_ids),
+            batch_size=BATCH_SIZE,
+        )
+        return post_ids
+
+    def report(self, name, repeat, function):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write("%-20s median %.3f ms, max %.3f ms" % (
+            name, timings[len(timings) // 2], timings[-1]
+        ))
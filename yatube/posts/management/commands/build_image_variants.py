@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Build thumbnails and responsive variants for post images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Rebuild posts that already have variants",
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["force"]:
+            posts = posts.filter(Q(image_variants="") | Q(thumbnail=""))
+        post_ids = list(posts.order_by("pk").values_list("pk", flat=True))
+        self.stdout.write("Processing %s images" % len(post_ids))
+        started = time.monotonic()
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = [
+                executor.submit(
+                    images.run_in_worker, images.process_image, post_id
+                )
+                for post_id in post_ids
+            ]
+            for post_id, future in zip(post_ids, futures):
+                try:
+                    future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write("Post %s: %s" % (post_id, error))
+                else:
+                    done += 1
+                if done and done % 100 == 0:
+                    self.report(done, started)
+        self.report(done, started)
+        if failed:
+            self.stderr.write("%s images failed" % failed)
+
+    def report(self, done, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write("%s images in %.1fs (%.1f images/s)" % (
+            done, elapsed, done / elapsed
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from yatube.db import run_write
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the popular feed's score epoch to now and drop decayed "
+        "scores; run it periodically, e.g. hourly from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="Recompute all scores from recent comments instead",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            count = run_write(trending.rebuild)
+            self.stdout.write(self.style.SUCCESS(
+                "Rebuilt %s scores" % count
+            ))
+            return
+        kept, removed = run_write(trending.compact)
+        self.stdout.write(self.style.SUCCESS(
+            "Kept %s scores, removed %s" % (kept, removed)
+        ))
@@ -0,0 +1,62 @@
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.bulk import FIELDS, TYPES, export_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream users, groups, posts, comments and follows to NDJSON, "
+        "or one of them to CSV"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="File to write, default stdout")
+        parser.add_argument(
+            "--format", choices=("ndjson", "csv"), default="ndjson",
+        )
+        parser.add_argument(
+            "--type", dest="types", action="append", choices=TYPES,
+            help="Export only this type, can be repeated",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        types = options["types"] or TYPES
+        if options["format"] == "csv" and len(types) != 1:
+            raise CommandError("CSV export needs exactly one --type")
+        if options["output"]:
+            with open(options["output"], "w", newline="",
+                      encoding="utf-8") as output:
+                count, elapsed = self.export(output, types, options)
+            self.stdout.write("%s records in %.1fs (%.0f/s)" % (
+                count, elapsed, count / max(elapsed, 1e-6)
+            ))
+        else:
+            self.export(sys.stdout, types, options)
+
+    def export(self, output, types, options):
+        started = time.monotonic()
+        records = export_records(types, options["chunk_size"])
+        if options["format"] == "csv":
+            writer = csv.DictWriter(
+                output, FIELDS[types[0]], extrasaction="ignore"
+            )
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(record):
+                # DjangoJSONEncoder would cut dates to milliseconds.
+                output.write(json.dumps(
+                    record, default=datetime.isoformat, ensure_ascii=False
+                ) + "\n")
+        count = 0
+        for record in records:
+            write(record)
+            count += 1
+        return count, time.monotonic() - started
@@ -0,0 +1,247 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from PIL import Image, ImageDraw
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from posts import counters, page_cache, search
+from posts.models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 500
+WORDS = (
+    "книга кот собака дом лес река город машина программа новость утро "
+    "вечер друг работа море солнце дорога музыка фильм история письмо "
+    "погода зима лето весна осень поезд школа команда проект идея вопрос "
+    "ответ встреча праздник кофе чай сад окно мост парк улица небо звезда "
+    "читать писать думать смотреть слушать гулять строить искать найти "
+    "новый старый большой маленький красивый быстрый тихий яркий"
+).split()
+
+
+def sentence(rng, low, high):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return " ".join(words).capitalize() + "."
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic dataset for benchmarks: "
+        "authors and followers follow a power law"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=50000)
+        parser.add_argument(
+            "--follows", type=int, default=20,
+            help="Average number of authors each user follows",
+        )
+        parser.add_argument(
+            "--images", type=int, default=0,
+            help="Number of posts that get a generated image",
+        )
+        parser.add_argument(
+            "--alpha", type=float, default=1.1,
+            help="Power-law exponent of author popularity",
+        )
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--prefix", default="bench",
+            help="Prefix of generated usernames and group slugs",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        self.now = timezone.now()
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                "Users named %s* already exist, pick another --prefix"
+                % prefix
+            )
+        self.step("users", self.create_users)
+        self.step("groups", self.create_groups)
+        self.step("posts", self.create_posts)
+        self.step("comments", self.create_comments)
+        self.step("follows", self.create_follows)
+        if options["images"]:
+            self.step("images", self.create_images, atomic=False)
+        self.step("counters", self.recount)
+        self.step("timelines", self.rebuild_timelines)
+        self.step("search index", search.rebuild)
+        page_cache.bump_generation("index")
+
+    def step(self, name, function, atomic=True):
+        started = time.monotonic()
+        if atomic:
+            # One transaction per step instead of a commit per write.
+            with transaction.atomic():
+                count = function()
+        else:
+            count = function()
+        self.stdout.write("%s: %s in %.1fs" % (
+            name, count, time.monotonic() - started
+        ))
+
+    def create_users(self):
+        password = make_password(None)
+        User.objects.bulk_create(
+            (
+                User(
+                    username="%s%05d" % (self.options["prefix"], number),
+                    password=password,
+                )
+                for number in range(self.options["users"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        self.user_ids = list(User.objects.filter(
+            username__startswith=self.options["prefix"]
+        ).order_by("pk").values_list("pk", flat=True))
+        # Popularity rank decides how often a user writes and is followed.
+        self.rng.shuffle(self.user_ids)
+        weights = [
+            1 / (rank + 1) ** self.options["alpha"]
+            for rank in range(len(self.user_ids))
+        ]
+        self.popularity = list(accumulate(weights))
+        return len(self.user_ids)
+
+    def popular_users(self, count):
+        return self.rng.choices(
+            self.user_ids, cum_weights=self.popularity, k=count
+        )
+
+    def create_groups(self):
+        prefix = self.options["prefix"]
+        Group.objects.bulk_create(
+            Group(
+                title="%s %s %s" % (prefix, self.rng.choice(WORDS), number),
+                slug="%s-%s" % (prefix, number),
+                description=sentence(self.rng, 5, 20),
+            )
+            for number in range(self.options["groups"])
+        )
+        self.group_ids = list(Group.objects.filter(
+            slug__startswith=prefix + "-"
+        ).order_by("pk").values_list("pk", flat=True))
+        return len(self.group_ids)
+
+    def random_date(self, start, seconds):
+        return start + timedelta(seconds=self.rng.uniform(0, seconds))
+
+    def create_posts(self):
+        count = self.options["posts"]
+        oldest = self.now - timedelta(days=self.options["days"])
+        dates = sorted(
+            self.random_date(oldest, self.options["days"] * 86400)
+            for _ in range(count)
+        )
+        authors = self.popular_users(count)
+        groups = self.group_ids + [None] * len(self.group_ids)
+        posts = (
+            Post(
+                author_id=author_id,
+                group_id=self.rng.choice(groups) if groups else None,
+                text=sentence(self.rng, 5, 80),
+                pub_date=pub_date,
+            )
+            for author_id, pub_date in zip(authors, dates)
+        )
+        Post.objects.bulk_create(posts, batch_size=BATCH_SIZE)
+        self.posts = list(self.own_posts().values_list("pk", "pub_date"))
+        return len(self.posts)
+
+    def own_posts(self):
+        return Post.objects.filter(
+            author__username__startswith=self.options["prefix"]
+        )
+
+    def create_comments(self):
+        if not self.posts:
+            return 0
+        count = self.options["comments"]
+        comments = []
+        for post_id, pub_date in self.rng.choices(self.posts, k=count):
+            seconds = (self.now - pub_date).total_seconds()
+            comments.append(Comment(
+                post_id=post_id,
+                author_id=self.rng.choice(self.user_ids),
+                text=sentence(self.rng, 2, 30),
+                created=self.random_date(pub_date, min(seconds, 7 * 86400)),
+            ))
+        Comment.objects.bulk_create(comments, batch_size=BATCH_SIZE)
+        return count
+
+    def create_follows(self):
+        average = self.options["follows"]
+        edges = set()
+        for user_id in self.user_ids:
+            wanted = min(
+                round(self.rng.expovariate(1 / average)) if average else 0,
+                len(self.user_ids) - 1,
+            )
+            authors = set()
+            for _ in range(wanted * 3):
+                if len(authors) >= wanted:
+                    break
+                author_id = self.popular_users(1)[0]
+                if author_id != user_id:
+                    authors.add(author_id)
+            edges.update((user_id, author_id) for author_id in authors)
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in edges),
+            batch_size=BATCH_SIZE,
+        )
+        return len(edges)
+
+    def create_images(self):
+        post_ids = self.rng.sample(
+            [post_id for post_id, _ in self.posts],
+            min(self.options["images"], len(self.posts)),
+        )
+        for post_id in post_ids:
+            image = Image.new("RGB", (1600, 1000), self.random_color())
+            draw = ImageDraw.Draw(image)
+            for _ in range(20):
+                x, y = self.rng.randrange(1600), self.rng.randrange(1000)
+                draw.ellipse(
+                    (x, y, x + self.rng.randrange(50, 600),
+                     y + self.rng.randrange(50, 600)),
+                    fill=self.random_color(),
+                )
+            data = io.BytesIO()
+            image.save(data, "JPEG", quality=85)
+            name = default_storage.save(
+                "posts/%s_%s.jpg" % (self.options["prefix"], post_id),
+                ContentFile(data.getvalue()),
+            )
+            Post.objects.filter(pk=post_id).update(image=name)
+        call_command("build_image_variants", stdout=self.stdout)
+        return len(post_ids)
+
+    def random_color(self):
+        return tuple(self.rng.randrange(256) for _ in range(3))
+
+    def recount(self):
+        counters.recount_posts(self.own_posts())
+        return counters.recount_users()
+
+    def rebuild_timelines(self):
+        call_command("rebuild_timelines", stdout=io.StringIO())
+        return len(self.user_ids)
@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import counters, page_cache, search
+from posts.bulk import TYPES, Importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Load users, groups, posts, comments and follows from NDJSON or "
+        "CSV in batches; an interrupted import continues with --resume"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format", choices=("ndjson", "csv"),
+            help="Default: guessed from the file extension",
+        )
+        parser.add_argument(
+            "--type", choices=TYPES, help="Record type of a CSV file",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Skip the records committed by an interrupted run",
+        )
+        parser.add_argument(
+            "--no-rebuild", action="store_true",
+            help=(
+                "Do not recount counters and rebuild timelines and "
+                "search; popular scores are credited as comments are "
+                "written"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or (
+            "csv" if path.endswith(".csv") else "ndjson"
+        )
+        if fmt == "csv" and not options["type"]:
+            raise CommandError("CSV import needs --type")
+        progress_path = path + ".progress"
+        skip = 0
+        if options["resume"] and os.path.exists(progress_path):
+            with open(progress_path) as progress_file:
+                skip = int(progress_file.read() or 0)
+            self.stdout.write("Resuming after %s records" % skip)
+
+        def progress(done, rate):
+            # Only committed batches are recorded.
+            with open(progress_path, "w") as progress_file:
+                progress_file.write(str(done))
+            self.stdout.write("%s records, %.0f/s" % (done, rate))
+
+        importer = Importer(options["batch_size"])
+        started = time.monotonic()
+        with open(path, newline="", encoding="utf-8") as source:
+            records = self.read(source, fmt, options["type"])
+            done = importer.run(records, skip, progress)
+        elapsed = time.monotonic() - started
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        self.stdout.write(
+            "%s records (%s written, %s skipped) in %.1fs, %.0f/s" % (
+                done - skip, importer.written, importer.skipped, elapsed,
+                (done - skip) / max(elapsed, 1e-6),
+            )
+        )
+        if not options["no_rebuild"]:
+            counters.recount_posts()
+            counters.recount_users()
+            call_command("rebuild_timelines", stdout=io.StringIO())
+            search.rebuild()
+            page_cache.bump_generation("index")
+
+    def read(self, source, fmt, record_type):
+        if fmt == "csv":
+            for row in csv.DictReader(source):
+                row["type"] = record_type
+                yield row
+            return
+        for number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                raise CommandError("Line %s: %s" % (number, error))
+            if record.get("type") not in TYPES:
+                raise CommandError("Line %s: unknown type %r" % (
+                    number, record.get("type")
+                ))
+            yield record
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts import timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized follow timelines from the Follow table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "usernames", nargs="*",
+            help="Only rebuild timelines of these users",
+        )
+
+    def handle(self, *args, **options):
+        # Users who follow nobody any more may still have old entries.
+        users = User.objects.filter(
+            Q(follower__isnull=False) | Q(timeline__isnull=False)
+        ).distinct()
+        if options["usernames"]:
+            users = User.objects.filter(username__in=options["usernames"])
+        count = 0
+        for user_id in users.values_list("id", flat=True).iterator():
+            timeline.rebuild(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            "Rebuilt %s timelines" % count
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized post, comment and follow counters"
+
+    def handle(self, *args, **options):
+        posts = counters.recount_posts()
+        users = counters.recount_users()
+        self.stdout.write(self.style.SUCCESS(
+            "Recounted %s posts and %s users" % (posts, users)
+        ))
@@ -0,0 +1,71 @@
+import multiprocessing
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+)
+
+import django
+from django.core.management.base import BaseCommand
+
+from posts import tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs in a pool of threads or processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--pool", choices=("thread", "process"), default="thread",
+        )
+        parser.add_argument(
+            "--burst", action="store_true",
+            help="Exit once no job is ready to run",
+        )
+        parser.add_argument(
+            "--poll", type=float, default=1.0,
+            help="Seconds to wait when the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if options["pool"] == "process":
+            # Spawned children set Django up themselves instead of
+            # sharing the parent's database connections.
+            pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        else:
+            pool = ThreadPoolExecutor(workers, thread_name_prefix="tasks")
+        worker = tasks.worker_id()
+        running = set()
+        done = failed = 0
+        started = time.monotonic()
+        with pool:
+            while True:
+                free = workers - len(running)
+                job_ids = tasks.claim(free, worker) if free else []
+                running.update(
+                    pool.submit(tasks.execute, job_id) for job_id in job_ids
+                )
+                if not running:
+                    if options["burst"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+                finished, running = wait(
+                    running, timeout=options["poll"],
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in finished:
+                    if future.result():
+                        done += 1
+                    else:
+                        failed += 1
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            "%s jobs done, %s attempts failed in %.1fs (%.1f/s)" % (
+                done, failed, elapsed, done / elapsed
+            )
+        )
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Email every user one digest of their unread notifications; run "
+        "it once per digest interval, from cron or with --every"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every", type=int,
+            help="Keep running and send digests every N seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            sent = notifications.send_digests()
+            self.stdout.write("%s digests sent in %.1fs" % (
+                sent, time.monotonic() - started
+            ))
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
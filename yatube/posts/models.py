@@ -1,4 +1,8 @@
-from django.db import models
+import json
+
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 from django.contrib.auth import get_user_model
 
@@ -14,11 +18,40 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        return self.select_related("author", "group")
+
+    def for_api(self):
+        return self.values(
+            "id", "text", "pub_date", "image", "thumbnail", "comment_count",
+            author_username=F("author__username"),
+            group_slug=F("group__slug"),
+        )
+
+
+class CommentQuerySet(models.QuerySet):
+    def for_thread(self):
+        return self.select_related("author").only(
+            "id", "post_id", "text", "created", "author__username"
+        )
+
+
+class AtomicSaveMixin:
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Post(AtomicSaveMixin, models.Model):
     text = models.TextField(
         verbose_name="Введите текст", help_text="Текст новой записи"
     )
-    pub_date = models.DateTimeField("date published", auto_now_add=True)
+    # A default rather than auto_now_add, so that imports can keep the
+    # original dates.
+    pub_date = models.DateTimeField(
+        "date published", default=timezone.now, editable=False
+    )
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="posts"
     )
@@ -38,6 +71,51 @@ class Post(models.Model):
         verbose_name="Изображение",
         help_text="Добавьте картинку к посту",
     )
+    thumbnail = models.CharField(max_length=255, blank=True, editable=False)
+    thumbnail_width = models.PositiveIntegerField(null=True, editable=False)
+    thumbnail_height = models.PositiveIntegerField(null=True, editable=False)
+    image_variants = models.TextField(blank=True, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    # Kept up to date with F() updates and by the image jobs; saving a
+    # stale instance must not write them back.
+    DERIVED_FIELDS = (
+        "comment_count", "version", "thumbnail", "thumbnail_width",
+        "thumbnail_height", "image_variants",
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        post.loaded_image = post.image_name()
+        return post
+
+    def image_name(self):
+        image = self.__dict__.get("image")
+        return getattr(image, "name", image)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            skip = set(self.DERIVED_FIELDS)
+            # sanitize_image swaps in a clean copy of the upload; only a
+            # new upload on this instance may replace it.
+            if self.image_name() == getattr(self, "loaded_image", None):
+                skip.add("image")
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skip
+            ]
+        super().save(*args, **kwargs)
+        self.loaded_image = self.image_name()
+
+    @property
+    def image_sources(self):
+        if not self.image_variants:
+            return []
+        return json.loads(self.image_variants)
 
     def __str__(self):
         auth = self.author
@@ -47,9 +125,22 @@ class Post(models.Model):
 
     class Meta:
         ordering = ("-pub_date",)
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="post_pub_date_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="post_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=["group", "-pub_date", "-id"],
+                name="post_group_pub_date_idx",
+            ),
+        ]
 
 
-class Comment(models.Model):
+class Comment(AtomicSaveMixin, models.Model):
     post = models.ForeignKey(
         Post, on_delete=models.CASCADE, related_name="comments"
     )
@@ -57,7 +148,11 @@ class Comment(models.Model):
         User, on_delete=models.CASCADE, related_name="comments"
     )
     text = models.TextField()
-    created = models.DateTimeField("date published", auto_now_add=True)
+    created = models.DateTimeField(
+        "date published", default=timezone.now, editable=False
+    )
+
+    objects = CommentQuerySet.as_manager()
 
     def __str__(self):
         post = self.post
@@ -68,9 +163,15 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ("created",)
+        indexes = [
+            models.Index(
+                fields=["post", "created", "id"],
+                name="comment_post_created_idx",
+            ),
+        ]
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveMixin, models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="follower"
     )
@@ -80,3 +181,158 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = (("user", "author"),)
+        indexes = [
+            models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name="stats"
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0, db_index=True)
+    following_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "%s %s %s %s" % (
+            self.user, self.posts_count,
+            self.followers_count, self.following_count
+        )
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+"
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ("-pub_date", "-post_id")
+        unique_together = (("user", "post"),)
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="timeline_user_pub_date_idx",
+            ),
+            models.Index(
+                fields=["user", "author"], name="timeline_user_author_idx"
+            ),
+        ]
+
+
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="search_terms"
+    )
+    weight = models.FloatField()
+    # The part of weight that comes from the post text; the rest comes
+    # from comments.
+    text_weight = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = (("term", "post"),)
+        indexes = [
+            models.Index(
+                fields=["term", "-weight"], name="searchterm_weight_idx"
+            ),
+        ]
+
+
+class Notification(models.Model):
+    # Covered by the (user, post) unique index.
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="notifications",
+        db_index=False,
+    )
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    created = models.DateTimeField(auto_now_add=True)
+    read = models.BooleanField(default=False)
+    emailed = models.BooleanField(default=False)
+
+    def __str__(self):
+        return "%s %s" % (self.user_id, self.post_id)
+
+    class Meta:
+        unique_together = (("user", "post"),)
+        indexes = [
+            models.Index(
+                fields=["user", "-id"], name="notification_user_id_idx"
+            ),
+            models.Index(
+                fields=["user"], name="notification_unread_idx",
+                condition=Q(read=False),
+            ),
+        ]
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUSES = (
+        (QUEUED, "queued"),
+        (RUNNING, "running"),
+        (FAILED, "failed"),
+    )
+
+    name = models.CharField(max_length=200)
+    args = models.TextField(default="[]")
+    # Set while queued: a second job with the same key is not added.
+    key = models.CharField(max_length=200, unique=True, null=True)
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "%s %s %s" % (self.name, self.args, self.status)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "-priority", "run_at", "id"],
+                name="job_queue_idx",
+            ),
+        ]
+
+
+class PostScore(models.Model):
+    # Decayed activity score relative to TrendingEpoch.started, see
+    # posts.trending.
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True, related_name="score"
+    )
+    score = models.FloatField(default=0)
+
+    def __str__(self):
+        return "%s %s" % (self.post_id, self.score)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-score", "-post"], name="post_score_rank_idx"
+            ),
+        ]
+
+
+class TrendingEpoch(models.Model):
+    started = models.DateTimeField()
+
+    def __str__(self):
+        return str(self.started)
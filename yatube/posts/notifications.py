@@ -0,0 +1,134 @@
+"""Notifications about new posts of followed authors.
+
+A new post queues fan_out(), which walks the author's followers in
+NOTIFICATION_BATCH_SIZE chunks along the (author, user) follow index
+and bulk-creates one row per follower and chunk. Unread counts are
+cached per user and dropped whenever that user gets new rows or reads
+them, once that write has committed, so a reader cannot cache the old
+count again in between.
+
+send_digests() mails each user with an address one message listing the
+unread posts collected since the previous run, so a user gets at most
+one email per run however many posts arrived.
+"""
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.urls import reverse
+
+from .models import Follow, Notification, Post, User
+from .tasks import task
+
+UNREAD_KEY = "notifications:unread:%s"
+DIGEST_USERS = 200
+
+
+@task(priority=5)
+def fan_out(post_id):
+    post = Post.objects.filter(pk=post_id).values("id", "author_id").first()
+    if post is None:
+        return 0
+    followers = Follow.objects.filter(
+        author_id=post["author_id"]
+    ).order_by("user_id").values_list("user_id", flat=True)
+    batch_size = settings.NOTIFICATION_BATCH_SIZE
+    created = 0
+    last = 0
+    while True:
+        user_ids = list(followers.filter(user_id__gt=last)[:batch_size])
+        if not user_ids:
+            return created
+        with transaction.atomic():
+            Notification.objects.bulk_create(
+                (Notification(user_id=user_id, post_id=post_id)
+                 for user_id in user_ids),
+                ignore_conflicts=True,
+            )
+        forget_unread(user_ids)
+        created += len(user_ids)
+        last = user_ids[-1]
+
+
+def forget_unread(user_ids):
+    keys = [UNREAD_KEY % user_id for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def unread_count(user_id):
+    key = UNREAD_KEY % user_id
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(
+            user_id=user_id, read=False
+        ).count()
+        cache.set(key, count, settings.NOTIFICATION_UNREAD_TIMEOUT)
+    return count
+
+
+def mark_read(user_id):
+    Notification.objects.filter(user_id=user_id, read=False).update(
+        read=True
+    )
+    forget_unread([user_id])
+
+
+def digest_message(user, rows, domain):
+    limit = settings.NOTIFICATION_DIGEST_MAX_POSTS
+    lines = []
+    for post in rows[:limit]:
+        url = reverse("post", args=[post.author.username, post.id])
+        lines.append("@%s: %s\nhttps://%s%s" % (
+            post.author.username, post.text[:200], domain, url
+        ))
+    if len(rows) > limit:
+        lines.append("И ещё записей: %s" % (len(rows) - limit))
+    return EmailMessage(
+        subject="Новые записи авторов, на которых вы подписаны: %s"
+        % len(rows),
+        body="\n\n".join(lines),
+        to=[user["email"]],
+    )
+
+
+def send_digests():
+    pending = Notification.objects.filter(emailed=False, read=False)
+    user_ids = pending.order_by("user_id").values_list(
+        "user_id", flat=True
+    ).distinct()
+    domain = Site.objects.get_current().domain
+    sent = 0
+    last = 0
+    while True:
+        batch = list(user_ids.filter(user_id__gt=last)[:DIGEST_USERS])
+        if not batch:
+            return sent
+        last = batch[-1]
+        rows = list(
+            pending.filter(user_id__in=batch)
+            .select_related("post__author").order_by("user_id", "-id")
+        )
+        if not rows:
+            # Read in the meantime.
+            continue
+        users = {
+            user["id"]: user for user in User.objects.filter(
+                pk__in=batch
+            ).exclude(email="").values("id", "email")
+        }
+        posts = {}
+        for row in rows:
+            if row.user_id in users:
+                posts.setdefault(row.user_id, []).append(row.post)
+        messages = [
+            digest_message(users[user_id], user_posts, domain)
+            for user_id, user_posts in posts.items()
+        ]
+        if messages:
+            get_connection().send_messages(messages)
+        # Rows added after the read above wait for the next digest.
+        pending.filter(
+            user_id__in=batch, id__lte=max(row.pk for row in rows)
+        ).update(emailed=True)
+        sent += len(messages)
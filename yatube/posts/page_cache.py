@@ -0,0 +1,71 @@
+"""Page cache invalidated by bumping a per-namespace generation.
+
+Cached pages remember the generation they were rendered for. Once the
+generation moves on, one request rebuilds the page under a lock while
+concurrent requests keep serving the previous copy.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import caches
+
+GENERATION_KEY = "page_cache:%s:generation"
+LOCK_TIMEOUT = 30
+
+
+def get_generation(namespace):
+    cache = caches["page"]
+    key = GENERATION_KEY % namespace
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock so an evicted counter never repeats a value.
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(namespace):
+    try:
+        return caches["page"].incr(GENERATION_KEY % namespace)
+    except ValueError:
+        return get_generation(namespace)
+
+
+def page_key(namespace, request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return "page_cache:%s:%s:%s" % (namespace, request.user.pk or 0, path)
+
+
+def generation_cache_page(namespace, timeout=600, stale_timeout=3600):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            cache = caches["page"]
+            key = page_key(namespace, request)
+            generation = get_generation(namespace)
+            entry = cache.get(key)
+            now = time.time()
+            if (entry is not None and entry["generation"] == generation
+                    and entry["expires"] > now):
+                return entry["response"]
+            lock_key = key + ":lock"
+            if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+                if entry is not None:
+                    return entry["response"]
+                return view(request, *args, **kwargs)
+            try:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    cache.set(key, {
+                        "generation": generation,
+                        "expires": now + timeout,
+                        "response": response,
+                    }, timeout + stale_timeout)
+                return response
+            finally:
+                cache.delete(lock_key)
+        return wrapper
+    return decorator
@@ -0,0 +1,124 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset paginator over a fixed ordering, without COUNT or OFFSET.
+
+    Cursors are opaque url-safe tokens holding the ordering values of the
+    boundary row and the direction to read in.
+    """
+
+    def __init__(self, object_list, per_page, ordering=("-pub_date", "-id")):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip("-") for name in self.ordering]
+        self.descending = self.ordering[0].startswith("-")
+
+    def _value(self, obj, name):
+        if isinstance(obj, dict):
+            return obj[name]
+        return getattr(obj, name)
+
+    def encode_cursor(self, obj, backwards=False):
+        values = [str(self._value(obj, name)) for name in self.fields]
+        data = json.dumps({"v": values, "b": backwards}).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values, backwards = data["v"], bool(data["b"])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            return None
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            return None
+        return values, backwards
+
+    def _reversed_ordering(self):
+        return [
+            name[1:] if name.startswith("-") else "-" + name
+            for name in self.ordering
+        ]
+
+    def _after(self, values, forwards):
+        lookup = "lt" if forwards == self.descending else "gt"
+        condition = Q()
+        for index in reversed(range(len(self.fields))):
+            name = self.fields[index]
+            current = Q(**{"%s__%s" % (name, lookup): values[index]})
+            if index < len(self.fields) - 1:
+                current |= Q(**{name: values[index]}) & condition
+            condition = current
+        return condition
+
+    def cursor_queryset(self, cursor):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is not None:
+            values, backwards = decoded
+            try:
+                queryset = self.object_list.filter(
+                    self._after(values, forwards=not backwards)
+                )
+            except (ValidationError, ValueError, TypeError):
+                pass
+            else:
+                if backwards:
+                    ordering = self._reversed_ordering()
+                else:
+                    ordering = self.ordering
+                return queryset.order_by(*ordering), True, backwards
+        return self.object_list.order_by(*self.ordering), False, False
+
+    def get_page(self, cursor=None):
+        queryset, has_cursor, backwards = self.cursor_queryset(cursor)
+        rows = list(queryset[:self.per_page + 1])
+        return self.build_page(rows, has_cursor, backwards)
+
+    def build_page(self, rows, has_cursor, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows)
+        if backwards:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, has_cursor
+        next_cursor = self.encode_cursor(rows[-1]) if has_next else None
+        previous_cursor = (
+            self.encode_cursor(rows[0], backwards=True)
+            if has_previous else None
+        )
+        return CursorPage(rows, next_cursor, previous_cursor)
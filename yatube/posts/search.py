@@ -0,0 +1,423 @@
+"""Full-text search over posts and their comments.
+
+Text is split into words and reduced with the Russian Snowball stemmer
+before indexing, so both backends match word forms. SQLite FTS5 is used
+when the posts_search_fts table exists; otherwise postings are kept in
+SearchTerm rows and ranked by TF-IDF in Python.
+
+Editing a post re-indexes its text only. A new or deleted comment adds
+or takes away just its own terms; the FTS5 row keeps one line of terms
+per comment for that.
+
+Results are ordered by (rank, post id), lower rank first, and paged with
+an opaque cursor holding the last rank and id.
+"""
+import base64
+import json
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Max, Q
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .models import Comment, Post, SearchTerm
+from .pagination import CursorPage
+from .tasks import task
+from .stemmer import stem
+
+FTS_TABLE = "posts_search_fts"
+DOCUMENT_COUNT_KEY = "search:documents"
+DOCUMENT_COUNT_TIMEOUT = 300
+# Postings of the rarest query term read per step, at least.
+POSTINGS_CHUNK = 200
+TEXT_WEIGHT = 2.0
+COMMENT_WEIGHT = 1.0
+WORD = re.compile(r"\w+")
+CYRILLIC = re.compile(r"[а-яё]")
+
+
+def tokenize(text):
+    terms = []
+    for word in WORD.findall(text.lower()):
+        if CYRILLIC.search(word):
+            word = stem(word)
+        if word:
+            terms.append(word[:64])
+    return terms
+
+
+def post_text(post_id):
+    return Post.objects.filter(pk=post_id).values_list(
+        "text", flat=True
+    ).first()
+
+
+def document(post_id):
+    text = post_text(post_id)
+    if text is None:
+        return None
+    comments = Comment.objects.filter(post_id=post_id).values_list(
+        "text", flat=True
+    )
+    return text, list(comments.iterator())
+
+
+def comment_line(text):
+    return " ".join(tokenize(text))
+
+
+class Fts5Backend:
+    name = "fts5"
+
+    def index(self, post_id):
+        self.remove(post_id)
+        doc = document(post_id)
+        if doc is None:
+            return
+        text, comments = doc
+        self.insert(post_id, text, [comment_line(c) for c in comments])
+
+    def insert(self, post_id, text, lines):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO %s (rowid, text, comments) "
+                "VALUES (%%s, %%s, %%s)" % FTS_TABLE,
+                [post_id, " ".join(tokenize(text)), "\n".join(lines)],
+            )
+
+    def comment_lines(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT comments FROM %s WHERE rowid = %%s" % FTS_TABLE,
+                [post_id],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return row[0].split("\n") if row[0] else []
+
+    def set_column(self, post_id, column, value):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE %s SET %s = %%s WHERE rowid = %%s"
+                % (FTS_TABLE, column), [value, post_id],
+            )
+
+    def index_text(self, post_id):
+        text = post_text(post_id)
+        if text is None:
+            return
+        if self.comment_lines(post_id) is None:
+            self.insert(post_id, text, [])
+        else:
+            self.set_column(post_id, "text", " ".join(tokenize(text)))
+
+    def add_comment(self, post_id, text):
+        line = comment_line(text)
+        lines = self.comment_lines(post_id)
+        if lines is None:
+            text = post_text(post_id)
+            if text is not None:
+                self.insert(post_id, text, [line])
+            return
+        # FTS5 rewrites the row from this column, without a trip to the
+        # comments table.
+        self.set_column(post_id, "comments", "\n".join(lines + [line]))
+
+    def remove_comment(self, post_id, text):
+        line = comment_line(text)
+        lines = self.comment_lines(post_id)
+        if lines and line in lines:
+            lines.remove(line)
+            self.set_column(post_id, "comments", "\n".join(lines))
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM %s WHERE rowid = %%s" % FTS_TABLE, [post_id]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s" % FTS_TABLE)
+
+    def search(self, terms, after, limit):
+        match = " ".join('"%s"' % term.replace('"', "") for term in terms)
+        sql = (
+            "SELECT score, id FROM ("
+            "SELECT bm25(%s, %s, %s) AS score, rowid AS id FROM %s "
+            "WHERE %s MATCH %%s) " % (
+                FTS_TABLE, TEXT_WEIGHT, COMMENT_WEIGHT, FTS_TABLE, FTS_TABLE
+            )
+        )
+        params = [match]
+        if after is not None:
+            sql += "WHERE score > %s OR (score = %s AND id > %s) "
+            params += [after[0], after[0], after[1]]
+        sql += "ORDER BY score, id LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class InvertedIndexBackend:
+    name = "python"
+
+    def index(self, post_id):
+        self.remove(post_id)
+        doc = document(post_id)
+        if doc is None:
+            return
+        text, comments = doc
+        text_weights = Counter()
+        for term in tokenize(text):
+            text_weights[term] += TEXT_WEIGHT
+        weights = Counter(text_weights)
+        for comment in comments:
+            for term in tokenize(comment):
+                weights[term] += COMMENT_WEIGHT
+        SearchTerm.objects.bulk_create(
+            SearchTerm(
+                term=term, post_id=post_id, weight=weight,
+                text_weight=text_weights[term],
+            )
+            for term, weight in weights.items()
+        )
+
+    def add_weights(self, post_id, weights, text=False):
+        """Add to the weight of each term, creating missing postings."""
+        rows = SearchTerm.objects.filter(post_id=post_id)
+        existing = set(rows.filter(term__in=list(weights)).values_list(
+            "term", flat=True
+        ))
+        by_value = defaultdict(list)
+        for term in existing:
+            by_value[weights[term]].append(term)
+        for value, terms in by_value.items():
+            fields = {"weight": F("weight") + value}
+            if text:
+                fields["text_weight"] = value
+            rows.filter(term__in=terms).update(**fields)
+        SearchTerm.objects.bulk_create(
+            SearchTerm(
+                term=term, post_id=post_id, weight=value,
+                text_weight=value if text else 0,
+            )
+            for term, value in weights.items()
+            if term not in existing and value > 0
+        )
+        rows.filter(weight__lte=0).delete()
+
+    def index_text(self, post_id):
+        text = post_text(post_id)
+        if text is None:
+            return
+        SearchTerm.objects.filter(post_id=post_id, text_weight__gt=0).update(
+            weight=F("weight") - F("text_weight"), text_weight=0
+        )
+        weights = Counter()
+        for term in tokenize(text):
+            weights[term] += TEXT_WEIGHT
+        self.add_weights(post_id, weights, text=True)
+
+    def comment_weights(self, text, sign):
+        weights = Counter()
+        for term in tokenize(text):
+            weights[term] += sign * COMMENT_WEIGHT
+        return weights
+
+    def add_comment(self, post_id, text):
+        if Post.objects.filter(pk=post_id).exists():
+            self.add_weights(post_id, self.comment_weights(text, 1))
+
+    def remove_comment(self, post_id, text):
+        self.add_weights(post_id, self.comment_weights(text, -1))
+
+    def remove(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    def clear(self):
+        SearchTerm.objects.all().delete()
+
+    def search(self, terms, after, limit):
+        stats = {
+            term: (count, max_weight)
+            for term, count, max_weight in SearchTerm.objects.filter(
+                term__in=set(terms)
+            ).values_list("term").annotate(
+                Count("id"), Max("weight")
+            ).order_by()
+        }
+        if len(stats) < len(set(terms)):
+            return []
+        total = document_count()
+        idf = {
+            term: math.log(1 + total / count)
+            for term, (count, _) in stats.items()
+        }
+        # Every match has a posting of the rarest term. Those are read
+        # best weight first, a chunk at a time, until no posting further
+        # down could still make it onto the page.
+        first, *rest = sorted(stats, key=lambda term: stats[term][0])
+        rest_bound = sum(
+            (1 + math.log(stats[term][1])) * idf[term] for term in rest
+        )
+        postings = SearchTerm.objects.filter(term=first).order_by(
+            "-weight", "post_id"
+        ).values_list("post_id", "weight")
+        chunk_size = max(2 * limit, POSTINGS_CHUNK)
+        ranked = []
+        last = None
+        while True:
+            chunk = postings
+            if last is not None:
+                chunk = chunk.filter(
+                    Q(weight__lt=last[1])
+                    | Q(weight=last[1], post_id__gt=last[0])
+                )
+            chunk = list(chunk[:chunk_size])
+            if not chunk:
+                break
+            last = chunk[-1]
+            scores = {
+                post_id: (1 + math.log(weight)) * idf[first]
+                for post_id, weight in chunk
+            }
+            for term in rest:
+                weights = dict(SearchTerm.objects.filter(
+                    term=term, post_id__in=list(scores)
+                ).values_list("post_id", "weight"))
+                scores = {
+                    post_id: score + (1 + math.log(weights[post_id]))
+                    * idf[term]
+                    for post_id, score in scores.items()
+                    if post_id in weights
+                }
+            # Negate so that, as with bm25(), a lower rank is a better
+            # match.
+            ranked.extend(
+                row for row in (
+                    (-score, post_id) for post_id, score in scores.items()
+                )
+                if after is None or row > tuple(after)
+            )
+            ranked = sorted(ranked)[:limit]
+            best_left = -(
+                (1 + math.log(last[1])) * idf[first] + rest_bound
+            )
+            if len(chunk) < chunk_size or (
+                    len(ranked) == limit and ranked[-1][0] < best_left):
+                break
+        return ranked
+
+
+def document_count():
+    """Number of posts for IDF, refreshed every DOCUMENT_COUNT_TIMEOUT."""
+    count = cache.get(DOCUMENT_COUNT_KEY)
+    if count is None:
+        count = Post.objects.count()
+        cache.set(DOCUMENT_COUNT_KEY, count, DOCUMENT_COUNT_TIMEOUT)
+    return max(count, 1)
+
+
+_fts5_tables = {}
+
+
+def fts5_available():
+    if connection.vendor != "sqlite":
+        return False
+    name = connection.settings_dict["NAME"]
+    if name not in _fts5_tables:
+        _fts5_tables[name] = (
+            FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts5_tables[name]
+
+
+@receiver(post_migrate)
+def forget_fts5_tables(**kwargs):
+    # A migration may have created the table since the last check.
+    _fts5_tables.clear()
+
+
+def get_backend():
+    name = settings.SEARCH_BACKEND
+    if name == "auto":
+        name = "fts5" if fts5_available() else "python"
+    if name == "fts5":
+        return Fts5Backend()
+    return InvertedIndexBackend()
+
+
+@task()
+def index_post(post_id):
+    get_backend().index_text(post_id)
+
+
+@task()
+def add_comment(post_id, text):
+    get_backend().add_comment(post_id, text)
+
+
+@task()
+def remove_comment(post_id, text):
+    get_backend().remove_comment(post_id, text)
+
+
+def remove_post(post_id):
+    get_backend().remove(post_id)
+
+
+def rebuild(batch_size=500):
+    backend = get_backend()
+    backend.clear()
+    count = 0
+    for post_id in Post.objects.values_list("pk", flat=True).iterator(
+            chunk_size=batch_size):
+        backend.index(post_id)
+        count += 1
+    return count
+
+
+def encode_cursor(rank, post_id):
+    data = json.dumps([rank, post_id]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, post_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(rank), int(post_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def search(query, cursor=None, per_page=10):
+    terms = tokenize(query)
+    if not terms:
+        return CursorPage([])
+    after = decode_cursor(cursor) if cursor else None
+    rows = get_backend().search(terms, after, per_page + 1)
+    page_rows = rows[:per_page]
+    posts = Post.objects.for_feed().in_bulk(
+        [post_id for _, post_id in page_rows]
+    )
+    results = [posts[post_id] for _, post_id in page_rows if post_id in posts]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(*page_rows[-1])
+    return CursorPage(results, next_cursor)
+
+
+def post_ids(query, limit):
+    terms = tokenize(query)
+    if not terms:
+        return []
+    return [post_id for _, post_id in get_backend().search(terms, None, limit)]
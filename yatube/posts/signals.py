@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (
+    counters, notifications, page_cache, search, timeline, trending,
+)
+from .tasks import enqueue
+from .models import Comment, Follow, Post, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created:
+        counters.bump_version(instance.pk)
+        return
+    counters.change_user_count(instance.author_id, "posts_count", 1)
+    if settings.FOLLOW_TIMELINE_ENABLED:
+        enqueue(timeline.fan_out_post, instance.pk)
+    enqueue(notifications.fan_out, instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_user_count(instance.author_id, "posts_count", -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_comment_count(instance.post_id, 1)
+        trending.comment_added(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comment_count(instance.post_id, -1)
+    trending.comment_removed(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    counters.change_user_count(instance.author_id, "followers_count", 1)
+    counters.change_user_count(instance.user_id, "following_count", 1)
+    trending.author_followed(instance.author_id)
+    if settings.FOLLOW_TIMELINE_ENABLED:
+        enqueue(timeline.backfill, instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user_count(instance.author_id, "followers_count", -1)
+    counters.change_user_count(instance.user_id, "following_count", -1)
+    if settings.FOLLOW_TIMELINE_ENABLED:
+        enqueue(timeline.prune, instance.user_id, instance.author_id)
+        if timeline.just_demoted(instance.author_id):
+            enqueue(timeline.backfill_followers, instance.author_id,
+                    key="backfill_followers:%s" % instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_index(sender, **kwargs):
+    if not kwargs.get("raw"):
+        page_cache.bump_generation("index")
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        enqueue(search.index_post, instance.pk,
+                key="index_post:%s" % instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_indexed_comment(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance.indexed_text = Comment.objects.filter(
+            pk=instance.pk
+        ).values_list("text", flat=True).first()
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    indexed = getattr(instance, "indexed_text", None)
+    if not created and indexed == instance.text:
+        return
+    if indexed is not None:
+        enqueue(search.remove_comment, instance.post_id, indexed)
+    enqueue(search.add_comment, instance.post_id, instance.text)
+    instance.indexed_text = instance.text
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    enqueue(search.remove_comment, instance.post_id, instance.text)
@@ -0,0 +1,139 @@
+"""Database-backed queue for work that can happen after a response.
+
+enqueue() adds a Job row in the caller's transaction, so a job exists
+exactly when the write that asked for it was committed. The run_tasks
+command claims jobs by priority, runs them in a thread or process pool
+and retries failures with exponential backoff. Each job runs in one
+run_write() transaction with its removal from the queue, so on SQLite
+two jobs never write at the same time. A job enqueued with a key is
+dropped while another job with that key is still queued, which folds
+repeated requests for the same work into one.
+
+With TASKS_EAGER the function runs inline instead, as in tests.
+"""
+import json
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from yatube.db import run_write
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def task(priority=0, max_attempts=None):
+    """Mark a module-level function as a task and set its defaults."""
+    def decorator(function):
+        function.task_options = {
+            "priority": priority,
+            "max_attempts": max_attempts,
+        }
+        return function
+    return decorator
+
+
+def task_name(function):
+    return "%s.%s" % (function.__module__, function.__name__)
+
+
+def enqueue(function, *args, key=None, priority=None, delay=0):
+    # Arguments are stored as JSON; eager mode checks that they fit too.
+    args = json.loads(json.dumps(args))
+    if settings.TASKS_EAGER:
+        return function(*args)
+    options = getattr(function, "task_options", {})
+    if priority is None:
+        priority = options.get("priority", 0)
+    job = Job(
+        name=task_name(function),
+        args=json.dumps(args),
+        key=key,
+        priority=priority,
+        max_attempts=(
+            options.get("max_attempts") or settings.TASKS_MAX_ATTEMPTS
+        ),
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if key is None:
+        job.save()
+    else:
+        Job.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def worker_id():
+    return "%s:%s" % (socket.gethostname(), os.getpid())
+
+
+def claim(limit, worker):
+    def take():
+        now = timezone.now()
+        # Jobs of a worker that died mid-run go back to the queue.
+        Job.objects.filter(
+            status=Job.RUNNING,
+            locked_at__lt=now - timedelta(seconds=settings.TASKS_LOCK_TIMEOUT),
+        ).update(status=Job.QUEUED)
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by("-priority", "run_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        # A running job gives up its key, so new work is queued again.
+        Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now,
+            key=None, attempts=F("attempts") + 1,
+        )
+        return list(
+            Job.objects.filter(pk__in=ids, locked_by=worker, locked_at=now)
+            .order_by("-priority", "run_at", "id")
+            .values_list("id", flat=True)
+        )
+    return run_write(take)
+
+
+def execute(job_id):
+    close_old_connections()
+    try:
+        try:
+            return run_write(run_job, job_id)
+        except Exception as error:
+            logger.exception("Job %s failed", job_id)
+            run_write(retry_or_fail, job_id, error)
+            return False
+    finally:
+        close_old_connections()
+
+
+def run_job(job_id):
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        return False
+    function = import_string(job.name)
+    function(*json.loads(job.args))
+    Job.objects.filter(pk=job_id).delete()
+    return True
+
+
+def retry_or_fail(job_id, error):
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        return
+    jobs = Job.objects.filter(pk=job_id)
+    message = "%s: %s" % (type(error).__name__, error)
+    if job.attempts >= job.max_attempts:
+        jobs.update(status=Job.FAILED, last_error=message)
+        return
+    backoff = settings.TASKS_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+    jobs.update(
+        status=Job.QUEUED, last_error=message,
+        run_at=timezone.now() + timedelta(seconds=backoff),
+    )
@@ -1,9 +1,51 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import tracemalloc
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.http.multipartparser import MultiPartParser
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import QuerySet
+from django.template import Context, Template
+from django.test import (
+    Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+)
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from .models import Group, Post, User, Follow, Comment
+from yatube import cache_backends, db, metrics
+from yatube.querycheck import (
+    QueryBudgetMixin, QueryCollector, QueryInspectorMiddleware, QueryProblem,
+)
+
+from . import images, notifications, page_cache, search, tasks, trending
+from .templatetags import cards
+from .models import (
+    Comment, Follow, Group, Job, Notification, Post, PostScore, SearchTerm,
+    TimelineEntry, TrendingEpoch, User, UserStats,
+)
+from .bulk import Importer
+from .forms import PostForm
+from .pagination import CursorPaginator
+from .uploads import LimitedImageUploadHandler
 
 
 class PostTestCase(TestCase):
@@ -116,14 +158,28 @@ class PageTest(TestCase):
         )
         response = self.client.get(reverse("index"))
         self.assertContains(response, post1.text)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("index"))
         post2 = Post.objects.create(
             author=self.user, text="test_text22", group=self.group,
         )
         response2 = self.client.get(reverse("index"))
-        self.assertNotContains(response2, post2.text)
-        cache.clear()
-        response3 = self.client.get(reverse("index"))
-        self.assertContains(response3, post2.text)
+        self.assertContains(response2, post2.text)
+
+    def test_cache_serves_stale_page_while_rebuilding(self):
+        Post.objects.create(author=self.user, text="old_text")
+        self.client.get(reverse("index"))
+        request = RequestFactory().get(reverse("index"))
+        request.user = self.user
+        key = page_cache.page_key("index", request)
+        caches["page"].add(key + ":lock", 1)
+        Post.objects.create(author=self.user, text="new_text")
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "old_text")
+        self.assertNotContains(response, "new_text")
+        caches["page"].delete(key + ":lock")
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "new_text")
 
 
 class FollowCommentTest(TestCase):
@@ -169,7 +225,24 @@ class FollowCommentTest(TestCase):
         self.assertEqual(Comment.objects.all().count(), 1)
 
 
-class ImageTest(TestCase):
+class TempMediaMixin:
+    """Store uploads and generated images in a throwaway MEDIA_ROOT."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class ImageTest(TempMediaMixin, TestCase):
     def setUp(self):
         self.client = Client()
         self.user = User.objects.create_user(username="test_user")
@@ -222,3 +295,1848 @@ class ImageTest(TestCase):
                 "или не является изображением."
             ),
         )
+
+
+class FeedQueryCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="reader")
+        self.client.force_login(self.user)
+        self.writer = User.objects.create_user(username="writer")
+        self.group = Group.objects.create(
+            slug="test_group", title="test_group", description="test_desc"
+        )
+        Follow.objects.create(user=self.user, author=self.writer)
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                author=self.writer, text="text %s" % i, group=self.group
+            )
+            Comment.objects.create(post=post, author=self.user, text="c")
+
+    def assert_feed_queries(self, posts_count):
+        urls = {
+            reverse("index"): 3,
+            reverse("group_posts", args=[self.group.slug]): 6,
+            reverse("profile", args=[self.writer.username]): 7,
+            reverse("follow_index"): 5,
+        }
+        for url, queries in urls.items():
+            with self.subTest(url=url, posts=posts_count):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url)
+                self.assertEqual(
+                    len(response.context["page"]), min(posts_count, 10)
+                )
+
+    def test_feed_queries_do_not_grow_with_page_size(self):
+        self.create_posts(1)
+        self.assert_feed_queries(1)
+        self.create_posts(14)
+        self.assert_feed_queries(15)
+
+    def test_comment_count_annotation(self):
+        self.create_posts(1)
+        post = Post.objects.for_feed().get()
+        self.assertEqual(post.comment_count, 1)
+        response = self.client.get(
+            reverse("post", args=[self.writer.username, post.id])
+        )
+        self.assertContains(response, "1 комментариев")
+
+
+class CursorPaginatorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="writer")
+        self.posts = [
+            Post.objects.create(author=self.user, text="post %s" % i)
+            for i in range(25)
+        ]
+        self.newest_first = sorted(
+            self.posts, key=lambda post: (post.pub_date, post.id),
+            reverse=True
+        )
+
+    def test_walk_forwards_and_backwards(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        first = paginator.get_page(None)
+        self.assertFalse(first.has_previous())
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertFalse(third.has_next())
+        self.assertEqual(
+            list(first) + list(second) + list(third), self.newest_first
+        )
+        back = paginator.get_page(third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertEqual(
+            list(paginator.get_page(back.previous_cursor)), list(first)
+        )
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        for cursor in ("garbage", "eyJ2IjogWyJ4IiwgIjEiXSwgImIiOiBmYWxzZX0"):
+            with self.subTest(cursor=cursor):
+                page = paginator.get_page(cursor)
+                self.assertEqual(list(page), self.newest_first[:10])
+
+    def test_feed_uses_cursor_without_count(self):
+        response = self.client.get(reverse("index"))
+        cursor = response.context["page"].next_cursor
+        self.assertContains(response, "?cursor=%s" % cursor)
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("index"), {"cursor": cursor})
+        self.assertEqual(
+            list(response.context["page"]), self.newest_first[10:20]
+        )
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="reader")
+        self.client.force_login(self.user)
+        self.writer = User.objects.create_user(username="writer")
+        self.old_post = Post.objects.create(author=self.writer, text="old")
+
+    def feed(self):
+        response = self.client.get(reverse("follow_index"))
+        return list(response.context["page"])
+
+    def test_follow_backfills_and_new_post_fans_out(self):
+        self.client.get(reverse("profile_follow", args=[self.writer]))
+        self.assertEqual(self.feed(), [self.old_post])
+        writer_client = Client()
+        writer_client.force_login(self.writer)
+        writer_client.post(reverse("new_post"), {"text": "fresh"})
+        new_post = Post.objects.get(text="fresh")
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=new_post
+        ).exists())
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+
+    def test_unfollow_prunes(self):
+        self.client.get(reverse("profile_follow", args=[self.writer]))
+        self.client.get(reverse("profile_unfollow", args=[self.writer]))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(FOLLOW_TIMELINE_FANOUT_LIMIT=0)
+    def test_large_authors_are_merged_on_read(self):
+        other = User.objects.create_user(username="other")
+        Follow.objects.create(user=self.user, author=self.writer)
+        cache.clear()
+        post = Post.objects.create(author=self.writer, text="celebrity")
+        self.assertFalse(TimelineEntry.objects.exists())
+        with self.settings(FOLLOW_TIMELINE_FANOUT_LIMIT=1):
+            Follow.objects.create(user=self.user, author=other)
+            other_post = Post.objects.create(author=other, text="regular")
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list("post", flat=True)),
+            [other_post.id],
+        )
+        cache.clear()
+        self.assertEqual(self.feed(), [other_post, post, self.old_post])
+
+    def test_rebuild_command(self):
+        Follow.objects.create(user=self.user, author=self.writer)
+        TimelineEntry.objects.all().delete()
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.assertEqual(self.feed(), [self.old_post])
+
+    @override_settings(FOLLOW_TIMELINE_FANOUT_LIMIT=1)
+    def test_demoted_author_is_backfilled(self):
+        other = User.objects.create_user(username="other")
+        Follow.objects.create(user=self.user, author=self.writer)
+        Follow.objects.create(user=other, author=self.writer)
+        post = Post.objects.create(author=self.writer, text="celebrity")
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.feed(), [post, self.old_post])
+        Follow.objects.filter(user=other).delete()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=post
+        ).exists())
+        self.assertEqual(self.feed(), [post, self.old_post])
+
+    def test_rebuild_clears_users_without_follows(self):
+        Follow.objects.create(user=self.user, author=self.writer)
+        Follow.objects.filter(user=self.user).delete()
+        TimelineEntry.objects.create(
+            user=self.user, post=self.old_post, author=self.writer,
+            pub_date=self.old_post.pub_date,
+        )
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+
+class QueryPlanTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="reader")
+        self.client.force_login(self.user)
+        self.writer = User.objects.create_user(username="writer")
+        self.group = Group.objects.create(
+            slug="test_group", title="test_group", description="test_desc"
+        )
+        Follow.objects.create(user=self.user, author=self.writer)
+        for i in range(12):
+            self.post = Post.objects.create(
+                author=self.writer, text="text %s" % i, group=self.group
+            )
+            Comment.objects.create(post=self.post, author=self.user, text="c")
+
+    def assert_indexed(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        for query in queries.captured_queries:
+            if not query["sql"].startswith("SELECT"):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                self.assertNotIn("TEMP B-TREE", step, query["sql"])
+                if step.startswith("SCAN"):
+                    self.assertIn("USING", step, query["sql"])
+        return response
+
+    def test_views_use_indexes(self):
+        urls = [
+            reverse("index"),
+            reverse("group_posts", args=[self.group.slug]),
+            reverse("profile", args=[self.writer.username]),
+            reverse("post", args=[self.writer.username, self.post.id]),
+            reverse("follow_index"),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.assert_indexed(url)
+                page = response.context.get("page")
+                if page is not None and page.has_next():
+                    self.assert_indexed(url + "?cursor=" + page.next_cursor)
+
+
+class CounterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="reader")
+        self.client.force_login(self.user)
+        self.writer = User.objects.create_user(username="writer")
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(author=self.writer, text="text")
+        comment = Comment.objects.create(
+            post=post, author=self.user, text="c"
+        )
+        Follow.objects.create(user=self.user, author=self.writer)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.writer).posts_count, 1)
+        self.assertEqual(self.stats(self.writer).followers_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        comment.delete()
+        Follow.objects.filter(user=self.user).delete()
+        post.delete()
+        self.assertEqual(Post.objects.filter(comment_count__gt=0).count(), 0)
+        for user in (self.user, self.writer):
+            stats = self.stats(user)
+            self.assertEqual(
+                (stats.posts_count, stats.followers_count,
+                 stats.following_count),
+                (0, 0, 0),
+            )
+
+    def test_deleting_user_leaves_no_stats(self):
+        Post.objects.create(author=self.writer, text="text")
+        Follow.objects.create(user=self.writer, author=self.user)
+        self.writer.delete()
+        self.assertFalse(UserStats.objects.filter(pk=self.writer.pk).exists())
+        self.assertEqual(self.stats(self.user).followers_count, 0)
+
+    def test_recount_repairs_drift(self):
+        post = Post.objects.create(author=self.writer, text="text")
+        Comment.objects.create(post=post, author=self.user, text="c")
+        Follow.objects.create(user=self.user, author=self.writer)
+        Post.objects.update(comment_count=7)
+        UserStats.objects.update(posts_count=5, followers_count=5)
+        UserStats.objects.filter(user=self.user).delete()
+        call_command("recount", stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.writer).posts_count, 1)
+        self.assertEqual(self.stats(self.writer).followers_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+
+    def test_edit_keeps_concurrent_comment_count(self):
+        post = Post.objects.create(author=self.writer, text="text")
+        stale = Post.objects.get(pk=post.pk)
+        Comment.objects.create(post=post, author=self.user, text="c")
+        # As in post_edit: the form saves an instance loaded earlier.
+        form = PostForm({"text": "edited"}, instance=stale)
+        self.assertTrue(form.is_valid())
+        form.save()
+        post.refresh_from_db()
+        self.assertEqual((post.text, post.comment_count), ("edited", 1))
+
+    def test_profile_fills_in_missing_stats(self):
+        User.objects.bulk_create([User(username="bulk")])
+        bulk = User.objects.get(username="bulk")
+        Post.objects.bulk_create([Post(author=bulk, text="text")])
+        post = Post.objects.get(author=bulk)
+        self.assertFalse(UserStats.objects.filter(user=bulk).exists())
+        response = self.client.get(reverse("profile", args=["bulk"]))
+        self.assertContains(response, "Количество записей: 1")
+        self.assertEqual(self.stats(bulk).posts_count, 1)
+        UserStats.objects.filter(user=bulk).delete()
+        response = self.client.get(reverse("post", args=["bulk", post.id]))
+        self.assertContains(response, "Количество записей: 1")
+        UserStats.objects.filter(user=bulk).delete()
+        response = self.client.get(reverse("api:profile", args=["bulk"]))
+        author = json.loads(response.content)["author"]
+        self.assertEqual(author["posts_count"], 1)
+
+    def test_profile_reads_counters_without_aggregates(self):
+        Post.objects.create(author=self.writer, text="text")
+        Follow.objects.create(user=self.user, author=self.writer)
+        urls = [
+            reverse("profile", args=[self.writer.username]),
+            reverse("post", args=[
+                self.writer.username, Post.objects.get().id
+            ]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertContains(response, "Подписчиков: 1")
+                self.assertContains(response, "Количество записей: 1")
+                for query in queries.captured_queries:
+                    self.assertNotIn("COUNT(", query["sql"])
+
+
+class PostCardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = Client()
+        self.reader.force_login(User.objects.create_user(username="reader"))
+        self.writer = User.objects.create_user(username="writer")
+        self.author = Client()
+        self.author.force_login(self.writer)
+        self.group = Group.objects.create(
+            slug="test_group", title="test_group", description="test_desc"
+        )
+        self.post = Post.objects.create(
+            author=self.writer, text="first", group=self.group
+        )
+        self.url = reverse("group_posts", args=[self.group.slug])
+
+    def card_key(self):
+        self.post.refresh_from_db()
+        return make_template_fragment_key("post_card", [
+            self.post.id, self.post.version,
+            self.writer.username, self.group.title,
+        ])
+
+    def test_stale_save_does_not_reset_version(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(post=self.post, author=self.writer, text="c")
+        self.post.refresh_from_db()
+        seen = self.post.version
+        stale.text = "edited"
+        stale.save()
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.version, seen)
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_card_is_cached_without_viewer_parts(self):
+        response = self.reader.get(self.url)
+        self.assertNotContains(response, "Редактировать")
+        fragment = caches["fragment"].get(self.card_key())
+        self.assertIsNotNone(fragment)
+        self.assertEqual(fragment.count("<div"), fragment.count("</div>"))
+        response = self.author.get(self.url)
+        self.assertContains(response, "Редактировать")
+
+    def test_writes_bump_version(self):
+        self.reader.get(self.url)
+        self.author.post(
+            reverse("post_edit", args=[self.writer.username, self.post.id]),
+            {"text": "edited", "group": self.group.pk},
+        )
+        response = self.reader.get(self.url)
+        self.assertContains(response, "edited")
+        self.reader.post(
+            reverse("add_comment", args=[self.writer.username, self.post.id]),
+            {"text": "comment"},
+        )
+        response = self.reader.get(self.url)
+        self.assertContains(response, "1 комментариев")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 2)
+
+
+class TwoTierCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.worker1 = self.make_worker("worker1")
+        self.worker2 = self.make_worker("worker2")
+
+    def make_worker(self, name):
+        cache_backends._stores.pop(name, None)
+        return cache_backends.TwoTierCache(name, {
+            "KEY_PREFIX": "test",
+            "OPTIONS": {
+                "SHARED": {
+                    "BACKEND": "django.core.cache.backends.filebased."
+                               "FileBasedCache",
+                    "LOCATION": self.directory.name,
+                },
+                "LOCAL_MAX_ENTRIES": 2,
+                "LOCAL_TIMEOUT": 60,
+                "SYNC_INTERVAL": 0,
+            },
+        })
+
+    def test_writes_invalidate_other_workers(self):
+        self.worker1.set("key", "first")
+        self.assertEqual(self.worker2.get("key"), "first")
+        self.worker1.set("key", "second")
+        self.assertEqual(self.worker2.get("key"), "second")
+        self.worker1.delete("key")
+        self.assertIsNone(self.worker2.get("key"))
+        self.worker1.clear()
+        self.assertIsNone(self.worker2.get("key"))
+
+    def test_local_tier_is_bounded_lru(self):
+        for key in ("a", "b", "c"):
+            self.worker1.set(key, key)
+        self.assertEqual(list(self.worker1.store.entries), [
+            self.worker1.make_key("b"), self.worker1.make_key("c")
+        ])
+        self.worker1.shared.set("b", "changed")
+        self.assertEqual(self.worker1.get("b"), "b")
+
+
+@override_settings(THUMBNAIL_ASYNC=False)
+class ThumbnailTest(TempMediaMixin, TestCase):
+    gif = (
+        b"\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04"
+        b"\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02"
+        b"\x02\x4c\x01\x00\x3b"
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.client.force_login(self.user)
+
+    def upload(self):
+        return SimpleUploadedFile(
+            name="small.gif", content=self.gif, content_type="image/gif"
+        )
+
+    def test_new_post_stores_thumbnail(self):
+        self.client.post(
+            reverse("new_post"), {"text": "text", "image": self.upload()}
+        )
+        post = Post.objects.get()
+        self.assertTrue(post.thumbnail)
+        self.assertEqual(
+            (post.thumbnail_width, post.thumbnail_height), (960, 339)
+        )
+        with mock.patch("PIL.Image.open") as image_open:
+            response = self.client.get(reverse("index"))
+        image_open.assert_not_called()
+        self.assertContains(response, post.thumbnail)
+
+    def test_placeholder_until_generated(self):
+        with self.settings(THUMBNAIL_ASYNC=True, TASKS_EAGER=False):
+            self.client.post(
+                reverse("new_post"), {"text": "text", "image": self.upload()}
+            )
+        post = Post.objects.get()
+        self.assertTrue(Job.objects.filter(
+            name="posts.images.process_upload",
+            key="process_upload:%s" % post.id,
+        ).exists())
+        self.assertEqual(post.thumbnail, "")
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "posts/placeholder.svg")
+
+
+@override_settings(THUMBNAIL_ASYNC=False)
+class ImageVariantTest(TempMediaMixin, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="test_user")
+
+    def jpeg(self, name):
+        content = BytesIO()
+        Image.new("RGB", (1200, 500), "red").save(content, "JPEG")
+        return SimpleUploadedFile(
+            name=name, content=content.getvalue(), content_type="image/jpeg"
+        )
+
+    def test_variants_and_srcset(self):
+        client = Client()
+        client.force_login(self.user)
+        client.post(
+            reverse("new_post"), {"text": "text", "image": self.jpeg("a.jpg")}
+        )
+        post = Post.objects.get()
+        types = [source["type"] for source in post.image_sources]
+        self.assertIn("image/webp", types)
+        self.assertEqual(types[-1], "image/jpeg")
+        self.assertIn("960w", post.image_sources[-1]["srcset"])
+        response = client.get(reverse("index"))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'sizes="(max-width: 960px)')
+
+    def test_rebuild_does_not_recompress_upload(self):
+        client = Client()
+        client.force_login(self.user)
+        client.post(
+            reverse("new_post"), {"text": "text", "image": self.jpeg("a.jpg")}
+        )
+        post = Post.objects.get()
+        with post.image.open() as stored:
+            content = stored.read()
+        call_command(
+            "build_image_variants", force=True, workers=1, stdout=StringIO()
+        )
+        post.refresh_from_db()
+        with post.image.open() as stored:
+            self.assertEqual(stored.read(), content)
+
+    def test_backfill_command_resumes(self):
+        for name in ("b.jpg", "c.jpg"):
+            Post.objects.create(
+                author=self.user, text="text", image=self.jpeg(name)
+            )
+        out = StringIO()
+        # One worker: the in-memory test database fails concurrent writers
+        # with "table is locked" instead of waiting for busy_timeout.
+        call_command("build_image_variants", workers=1, stdout=out)
+        self.assertIn("Processing 2 images", out.getvalue())
+        self.assertIn("images/s", out.getvalue())
+        self.assertFalse(Post.objects.filter(image_variants="").exists())
+        out = StringIO()
+        call_command("build_image_variants", stdout=out)
+        self.assertIn("Processing 0 images", out.getvalue())
+
+
+@override_settings(THUMBNAIL_ASYNC=False)
+class UploadTest(TempMediaMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.client.force_login(self.user)
+
+    def image(self, size, image_format="BMP", **params):
+        content = BytesIO()
+        Image.new("RGB", size, "blue").save(content, image_format, **params)
+        return content.getvalue()
+
+    def parse(self, body):
+        meta = {
+            "CONTENT_TYPE": MULTIPART_CONTENT,
+            "CONTENT_LENGTH": len(body),
+        }
+        request = RequestFactory().post("/")
+        handlers = [LimitedImageUploadHandler(request)]
+        return MultiPartParser(meta, BytesIO(body), handlers).parse()
+
+    def test_upload_memory_is_bounded(self):
+        content = self.image((2000, 1400))
+        body = encode_multipart(BOUNDARY, {
+            "text": "text",
+            "image": SimpleUploadedFile("big.bmp", content, "image/bmp"),
+        })
+        tracemalloc.start()
+        try:
+            data, files = self.parse(body)
+            form = PostForm(data, files)
+            self.assertTrue(form.is_valid(), form.errors)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(len(content), 8 * 1024 * 1024)
+        self.assertLess(peak, 1024 * 1024)
+
+    @override_settings(POST_IMAGE_MAX_BYTES=1024)
+    def test_byte_limit(self):
+        image = SimpleUploadedFile("a.bmp", self.image((100, 100)))
+        response = self.client.post(
+            reverse("new_post"), {"text": "text", "image": image}
+        )
+        self.assertFormError(
+            response, "form", "image", "Файл больше 1,0\xa0КБ."
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_pixel_limit(self):
+        image = SimpleUploadedFile("a.png", self.image((20, 20), "PNG"))
+        response = self.client.post(
+            reverse("new_post"), {"text": "text", "image": image}
+        )
+        self.assertFormError(
+            response, "form", "image", "Изображение больше 100 пикселей."
+        )
+
+    def test_limits_only_wrap_post_forms(self):
+        request = RequestFactory().post("/")
+        self.assertFalse(any(
+            isinstance(handler, LimitedImageUploadHandler)
+            for handler in request.upload_handlers
+        ))
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse("new_post"), {"text": "text"})
+        self.assertEqual(response.status_code, 403)
+
+    def test_metadata_is_stripped(self):
+        exif = Image.Exif()
+        exif[0x010e] = "secret description"
+        image = SimpleUploadedFile(
+            "a.jpg", self.image((50, 50), "JPEG", exif=exif.tobytes())
+        )
+        self.client.post(
+            reverse("new_post"), {"text": "text", "image": image}
+        )
+        post = Post.objects.get()
+        with post.image.open() as stored, Image.open(stored) as saved:
+            self.assertEqual(len(saved.getexif()), 0)
+
+    def test_sanitized_copy_replaces_upload(self):
+        image = SimpleUploadedFile("a.jpg", self.image((50, 50), "JPEG"))
+        with self.settings(THUMBNAIL_ASYNC=True, TASKS_EAGER=False):
+            self.client.post(
+                reverse("new_post"), {"text": "text", "image": image}
+            )
+        upload = Post.objects.get().image.name
+        images.sanitize_image(Post.objects.get().pk)
+        clean = Post.objects.get().image.name
+        self.assertNotEqual(clean, upload)
+        self.assertFalse(default_storage.exists(upload))
+        self.assertTrue(default_storage.exists(clean))
+
+    def test_stale_save_keeps_processed_image(self):
+        image = SimpleUploadedFile("a.jpg", self.image((50, 50), "JPEG"))
+        with self.settings(THUMBNAIL_ASYNC=True, TASKS_EAGER=False):
+            self.client.post(
+                reverse("new_post"), {"text": "text", "image": image}
+            )
+        stale = Post.objects.get()
+        upload = stale.image.name
+        images.process_upload(stale.pk)
+        stale.text = "edited"
+        stale.save()
+        post = Post.objects.get()
+        self.assertEqual(post.text, "edited")
+        self.assertNotEqual(post.image.name, upload)
+        self.assertTrue(default_storage.exists(post.image.name))
+        self.assertTrue(post.thumbnail)
+        self.assertTrue(post.image_variants)
+        image = SimpleUploadedFile("b.jpg", self.image((50, 50), "JPEG"))
+        self.client.post(
+            reverse("post_edit", args=[self.user.username, post.id]),
+            {"text": "again", "image": image},
+        )
+        self.assertTrue(Post.objects.get().image.name.startswith("posts/b"))
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="writer")
+        self.post = Post.objects.create(
+            author=self.user, text="Новая книга про котов"
+        )
+        self.commented = Post.objects.create(
+            author=self.user, text="Что почитать?"
+        )
+        Comment.objects.create(
+            post=self.commented, author=self.user, text="Советую книги"
+        )
+        Post.objects.create(author=self.user, text="Про собак")
+
+    def assert_backend_works(self):
+        search.rebuild()
+        page = search.search("книгами")
+        self.assertEqual(list(page), [self.post, self.commented])
+        self.assertEqual(list(search.search("книгами котов")), [self.post])
+        self.assertEqual(list(search.search("самолёт")), [])
+        Comment.objects.get().delete()
+        self.assertEqual(list(search.search("книга")), [self.post])
+        self.post.delete()
+        self.assertEqual(list(search.search("книга")), [])
+
+    def assert_updates_are_incremental(self):
+        search.rebuild()
+        with CaptureQueriesContext(connection) as queries:
+            comment = Comment.objects.create(
+                post=self.post, author=self.user, text="Смешные собаки"
+            )
+        for query in queries.captured_queries:
+            self.assertNotIn('FROM "posts_comment"', query["sql"])
+        self.assertEqual(
+            set(search.search("собак")),
+            {self.post, Post.objects.get(text="Про собак")},
+        )
+        comment.text = "Смешные птицы"
+        comment.save()
+        self.assertEqual(list(search.search("птиц")), [self.post])
+        self.assertNotIn(self.post, list(search.search("собак")))
+        self.post.text = "Новый журнал"
+        self.post.save()
+        self.assertEqual(list(search.search("книга")), [self.commented])
+        self.assertEqual(list(search.search("журнал птицы")), [self.post])
+        comment.delete()
+        self.assertEqual(list(search.search("птиц")), [])
+        self.assertEqual(list(search.search("журнал")), [self.post])
+
+    @override_settings(SEARCH_BACKEND="python")
+    def test_python_backend(self):
+        self.assert_backend_works()
+
+    @override_settings(SEARCH_BACKEND="python")
+    def test_python_backend_is_incremental(self):
+        self.assert_updates_are_incremental()
+        self.assertFalse(SearchTerm.objects.filter(weight__lte=0).exists())
+
+    def test_fts5_backend(self):
+        if not search.fts5_available():
+            self.skipTest("SQLite is built without FTS5")
+        with self.settings(SEARCH_BACKEND="fts5"):
+            self.assert_backend_works()
+
+    def test_fts5_backend_is_incremental(self):
+        if not search.fts5_available():
+            self.skipTest("SQLite is built without FTS5")
+        with self.settings(SEARCH_BACKEND="fts5"):
+            self.assert_updates_are_incremental()
+
+    @override_settings(SEARCH_BACKEND="python")
+    def test_python_backend_reads_few_postings(self):
+        search.rebuild()
+        for i in range(5):
+            Post.objects.create(author=self.user, text="котов %s" % i)
+        search.search("книга котов")
+        with CaptureQueriesContext(connection) as queries:
+            page = search.search("книга котов")
+        self.assertEqual(list(page), [self.post])
+        sql = [query["sql"] for query in queries.captured_queries]
+        self.assertFalse(any('FROM "posts_post"' in q and "COUNT" in q
+                             for q in sql))
+        # The rarer term goes first, a chunk at a time; the other one is
+        # limited to its posts.
+        self.assertIn("LIMIT", sql[1])
+        self.assertIn('"posts_searchterm"."post_id" IN', sql[2])
+
+    @override_settings(SEARCH_BACKEND="python")
+    def test_python_backend_pages_match_full_ranking(self):
+        for i in range(12):
+            Post.objects.create(
+                author=self.user, text="котов " * (i % 4 + 1) + "книга"
+            )
+        search.rebuild()
+        expected = search.InvertedIndexBackend().search(
+            ["кот", "книг"], None, 100
+        )
+        self.assertEqual(len(expected), 13)
+        with mock.patch("posts.search.POSTINGS_CHUNK", 1):
+            pages = []
+            cursor = None
+            while True:
+                page = search.search("котов книга", cursor, per_page=2)
+                pages.extend(post.id for post in page)
+                cursor = page.next_cursor
+                if not cursor:
+                    break
+        self.assertEqual(pages, [post_id for _, post_id in expected])
+
+    def test_admin_search_cap_is_reported(self):
+        admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "password"
+        )
+        self.client.force_login(admin)
+        url = reverse("admin:posts_post_changelist")
+        with mock.patch("posts.admin.PostAdmin.search_limit", 1):
+            response = self.client.get(url, {"q": "книга"}, follow=True)
+        self.assertEqual(len(response.context["cl"].result_list), 1)
+        self.assertContains(response, "Показаны 1 лучших совпадений")
+
+    def test_fts5_check_is_cached(self):
+        search._fts5_tables.clear()
+        with mock.patch.object(
+                connection.introspection, "table_names", return_value=[]
+        ) as table_names:
+            self.assertFalse(search.fts5_available())
+            self.assertFalse(search.fts5_available())
+        self.assertEqual(table_names.call_count, 1)
+        search.forget_fts5_tables()
+        self.assertEqual(search.fts5_available(), search.FTS_TABLE in (
+            connection.introspection.table_names()
+        ))
+
+    def test_stemmer(self):
+        self.assertEqual(
+            search.tokenize("Красивая книгами, прекраснейший ёж"),
+            ["красив", "книг", "прекрасн", "еж"],
+        )
+
+    def test_view_paginates_results(self):
+        for i in range(11):
+            Post.objects.create(author=self.user, text="книга номер %s" % i)
+        response = self.client.get(reverse("search"), {"q": "книги"})
+        page = response.context["page"]
+        self.assertEqual(len(page), 10)
+        self.assertContains(response, "q=%D0%BA%D0%BD%D0%B8%D0%B3%D0%B8")
+        response = self.client.get(
+            reverse("search"), {"q": "книги", "cursor": page.next_cursor}
+        )
+        self.assertEqual(len(response.context["page"]), 3)
+        self.assertFalse(response.context["page"].has_next())
+
+    def test_rebuild_command(self):
+        search.get_backend().clear()
+        self.assertEqual(list(search.search("книга")), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(
+            list(search.search("книга")), [self.post, self.commented]
+        )
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="reader")
+        self.author = User.objects.create_user(username="writer")
+        self.group = Group.objects.create(
+            title="group", slug="group", description="description"
+        )
+        self.posts = [
+            Post.objects.create(
+                author=self.author, group=self.group, text="post %s" % i
+            )
+            for i in range(12)
+        ]
+
+    def test_feeds(self):
+        urls = [
+            reverse("api:index"),
+            reverse("api:group_posts", args=[self.group.slug]),
+            reverse("api:profile", args=[self.author.username]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                self.assertEqual(len(data["results"]), 10)
+                self.assertEqual(data["results"][0]["text"], "post 11")
+                self.assertEqual(
+                    data["results"][0]["author_username"], "writer"
+                )
+                data = self.client.get(url, {"cursor": data["next"]}).json()
+                self.assertEqual(
+                    [row["text"] for row in data["results"]],
+                    ["post 1", "post 0"],
+                )
+        data = self.client.get(urls[2]).json()
+        self.assertEqual(data["author"]["posts_count"], 12)
+
+    def test_post_with_comments(self):
+        post = self.posts[0]
+        Comment.objects.create(post=post, author=self.user, text="comment")
+        data = self.client.get(
+            reverse("api:post", args=[self.author.username, post.id])
+        ).json()
+        self.assertEqual(data["text"], "post 0")
+        self.assertEqual(data["comment_count"], 1)
+        self.assertEqual(data["comments"][0]["author_username"], "reader")
+
+    def test_follow_feed(self):
+        url = reverse("api:follow_index")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).json()["results"], [])
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(len(self.client.get(url).json()["results"]), 10)
+
+    def test_conditional_get(self):
+        url = reverse("api:index")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        with mock.patch("posts.api.serialize_post") as serialize:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        serialize.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertNotIn("Last-Modified", response)
+        post = self.posts[-1]
+        post.text = "edited"
+        post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_deleted_comment_is_revalidated(self):
+        post = self.posts[0]
+        Comment.objects.create(post=post, author=self.user, text="first")
+        comment = Comment.objects.create(
+            post=post, author=self.user, text="second"
+        )
+        url = reverse(
+            "api:post_comments", args=[self.author.username, post.id]
+        )
+        comment.delete()
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 1)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="reader")
+        self.author = User.objects.create_user(username="writer")
+        self.group = Group.objects.create(
+            title="group", slug="group", description="description"
+        )
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text="text"
+        )
+        self.urls = [
+            reverse("post", args=[self.author.username, self.post.id]),
+            reverse("group_posts", args=[self.group.slug]),
+            reverse("profile", args=[self.author.username]),
+        ]
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_page_is_not_rendered(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response["ETag"].startswith('W/"'))
+                response = self.revalidate(url, response)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+                self.assertEqual(response.content, b"")
+
+    def test_changes_are_revalidated(self):
+        responses = [self.client.get(url) for url in self.urls]
+        Comment.objects.create(
+            post=self.post, author=self.user, text="comment"
+        )
+        for url, response in zip(self.urls, responses):
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, response).status_code,
+                                 200)
+        responses = [self.client.get(url) for url in self.urls]
+        self.post.text = "edited"
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        for url, response in zip(self.urls, responses):
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, response).status_code,
+                                 200)
+
+    def test_deleted_comment_is_revalidated(self):
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text="old"
+        )
+        Comment.objects.create(post=self.post, author=self.user, text="new")
+        responses = [self.client.get(url) for url in self.urls]
+        comment.delete()
+        for url, response in zip(self.urls, responses):
+            with self.subTest(url=url):
+                self.assertNotIn("Last-Modified", response)
+                self.assertEqual(self.revalidate(url, response).status_code,
+                                 200)
+
+    def test_cache_headers(self):
+        url = self.urls[0]
+        response = self.client.get(url)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("s-maxage=60", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+        etag = response["ETag"]
+        self.client.force_login(self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIsNotNone(response.context)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.user = User.objects.create_user(username="reader")
+        self.staff = User.objects.create_user(
+            username="admin", is_staff=True
+        )
+        self.post = Post.objects.create(author=self.user, text="text")
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_views_are_recorded(self):
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        self.client.get(reverse("post", args=["reader", self.post.id]))
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("metrics"))
+        text = response.content.decode()
+        self.assertEqual(response["Content-Type"],
+                         "text/plain; version=0.0.4")
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="index"} 2', text
+        )
+        self.assertIn('yatube_db_queries_count{view="post"} 1', text)
+        self.assertIn('yatube_template_duration_seconds_sum{view="post"}',
+                      text)
+        # The second index request is served from the page cache.
+        self.assertIn('yatube_cache_hits{view="index"} 3', text)
+        self.assertIn('yatube_cache_misses{view="index"} 2', text)
+        # Window values go down again, so nothing claims to be a counter.
+        self.assertIn("# TYPE yatube_request_duration_seconds_bucket gauge",
+                      text)
+        self.assertNotIn(" counter", text)
+        self.assertNotIn(" histogram", text)
+
+    @override_settings(
+        METRICS_SAMPLE_RATE=1, METRICS_TEMPLATES=False, METRICS_CACHES=False
+    )
+    def test_template_and_cache_metrics_can_be_switched_off(self):
+        self.client.get(reverse("index"))
+        self.client.force_login(self.staff)
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('yatube_db_queries_count{view="index"} 1', text)
+        self.assertNotIn("yatube_template_duration_seconds", text)
+        self.assertNotIn("yatube_cache_hits", text)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.get(reverse("index"))
+        self.client.force_login(self.staff)
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertNotIn('view="index"', text)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+
+class QueryInspectorTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="writer")
+        self.group = Group.objects.create(
+            title="group", slug="group", description="description"
+        )
+        for i in range(6):
+            Post.objects.create(author=self.user, group=self.group, text=i)
+
+    def test_repeated_queries_are_traced_to_template_line(self):
+        template = Template(
+            "{% for post in posts %}\n{{ post.comments.count }}\n"
+            "{% endfor %}"
+        )
+        collector = QueryCollector()
+        posts = list(Post.objects.all())
+        with collector.capture():
+            template.render(Context({"posts": posts}))
+        [group] = collector.repeated()
+        self.assertEqual(group.count, 6)
+        self.assertIn('"posts_comment"."post_id" = ?', group.sql)
+        self.assertEqual(list(group.origins), ["<unknown source>:2"])
+
+    def test_feeds_stay_within_budget(self):
+        urls = [
+            reverse("index"),
+            reverse("group_posts", args=[self.group.slug]),
+            reverse("profile", args=[self.user.username]),
+        ]
+        for url in urls:
+            with self.subTest(url=url), self.assertQueryBudget(8):
+                self.client.get(url)
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget(100):
+                for post in Post.objects.all():
+                    post.comments.exists()
+
+    def test_middleware(self):
+        def view(request):
+            for post in Post.objects.all():
+                post.comments.count()
+            return HttpResponse()
+
+        middleware = QueryInspectorMiddleware(view)
+        request = RequestFactory().get("/")
+        with self.settings(QUERY_INSPECTOR_RAISE=False), \
+                self.assertLogs("yatube.querycheck", "WARNING") as logs:
+            middleware(request)
+        self.assertIn(
+            "6 identical queries from posts/tests.py", logs.output[0]
+        )
+        with self.settings(QUERY_INSPECTOR_RAISE=True):
+            with self.assertRaises(QueryProblem):
+                middleware(request)
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command(
+            "generate_data", users=12, groups=2, posts=40, comments=30,
+            follows=3, stdout=StringIO(),
+        )
+
+    def test_generate_data(self):
+        self.assertEqual(User.objects.count(), 12)
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(Comment.objects.count(), 30)
+        self.assertEqual(
+            sum(UserStats.objects.values_list("posts_count", flat=True)), 40
+        )
+        self.assertEqual(
+            sum(Post.objects.values_list("comment_count", flat=True)), 30
+        )
+        self.assertGreater(
+            len(set(Post.objects.values_list("pub_date", flat=True))), 1
+        )
+        self.assertEqual(
+            TimelineEntry.objects.count(),
+            Post.objects.filter(author__following__isnull=False).count(),
+        )
+        with self.assertRaises(CommandError):
+            call_command("generate_data", users=1, stdout=StringIO())
+
+    def test_benchmark_compares_with_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark", requests=2, warmup=0, output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as results:
+                views = json.load(results)["views"]
+            self.assertEqual(set(views), {
+                "index", "group_posts", "new_post", "search",
+                "follow_index", "notifications", "popular", "profile",
+                "post", "post_comments", "post_edit",
+            })
+            self.assertGreater(views["post"]["queries"], 0)
+            for view in views.values():
+                view["queries"] = 0
+            with open(output, "w") as baseline:
+                json.dump({"views": views}, baseline)
+            with self.assertRaisesRegex(CommandError, "Regressions"):
+                call_command(
+                    "benchmark", requests=1, warmup=0, views=["post"],
+                    baseline=output, stdout=StringIO(),
+                )
+
+
+def add_sqlite_database(alias, directory, **options):
+    connections.databases[alias] = dict(
+        connections.databases["default"],
+        NAME=os.path.join(directory, alias + ".sqlite3"),
+        TEST={},
+        **options
+    )
+    call_command("migrate", database=alias, verbosity=0)
+
+
+def remove_database(alias):
+    connections[alias].close()
+    del connections.databases[alias]
+    if hasattr(connections._connections, alias):
+        delattr(connections._connections, alias)
+
+
+class ReplicaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        add_sqlite_database("replica", self.directory.name)
+        self.settings_override = override_settings(
+            DATABASE_REPLICAS=["replica"]
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username="writer")
+        Post.objects.create(author=self.user, text="on primary only")
+        # The replica lags behind: it has the user but not the post yet.
+        User.objects.db_manager("replica").bulk_create([
+            User(pk=self.user.pk, username="writer")
+        ])
+        Post.objects.using("replica").bulk_create([
+            Post(pk=100, author_id=self.user.pk, text="replicated earlier")
+        ])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        remove_database("replica")
+        self.directory.cleanup()
+
+    def test_read_only_views_use_replica(self):
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "replicated earlier")
+        self.assertNotContains(response, "on primary only")
+        response = self.client.get(reverse("new_post"))
+        self.assertNotIn(db.PIN_COOKIE, response.cookies)
+
+    def test_writes_pin_client_to_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("new_post"), {"text": "fresh"})
+        self.assertIn(db.PIN_COOKIE, response.cookies)
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "fresh")
+        self.assertContains(response, "on primary only")
+        self.client.cookies.pop(db.PIN_COOKIE)
+        response = self.client.get(reverse("profile", args=["writer"]))
+        self.assertContains(response, "replicated earlier")
+        self.assertNotContains(response, "fresh")
+
+    def test_missing_stats_are_read_back_from_primary(self):
+        UserStats.objects.filter(pk=self.user.pk).delete()
+        response = self.client.get(reverse("post", args=["writer", 100]))
+        self.assertContains(response, "replicated earlier")
+        self.assertTrue(UserStats.objects.filter(pk=self.user.pk).exists())
+
+    def test_unusable_connections_are_closed(self):
+        replica = connections["replica"]
+        replica.ensure_connection()
+        with mock.patch.object(replica, "is_usable", return_value=False):
+            db.check_connections()
+        self.assertIsNone(replica.connection)
+
+
+class SqliteWriteTest(TestCase):
+    THREADS = 8
+    WRITES = 20
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        add_sqlite_database("tuned", self.directory.name)
+
+    def tearDown(self):
+        remove_database("tuned")
+        self.directory.cleanup()
+
+    def write(self, slug):
+        # Read, then write: like get_or_create() in profile_follow.
+        Group.objects.using("tuned").filter(slug=slug).exists()
+        Group.objects.using("tuned").create(
+            slug=slug, title=slug, description="description"
+        )
+
+    def test_writes_begin_immediate(self):
+        connection = connections["tuned"]
+        with CaptureQueriesContext(connection) as queries:
+            db.run_write(self.write, "first", using="tuned")
+        self.assertEqual(queries[0]["sql"], "BEGIN IMMEDIATE")
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic(using="tuned"):
+                self.write("second")
+        self.assertNotIn(
+            "BEGIN IMMEDIATE", [query["sql"] for query in queries]
+        )
+        self.assertFalse(connection.begin_immediate)
+
+    def test_concurrent_writes(self):
+        with connections["tuned"].cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+        errors = []
+
+        def worker(number):
+            for i in range(self.WRITES):
+                slug = "group-%s-%s" % (number, i)
+                try:
+                    db.run_write(self.write, slug, using="tuned")
+                except OperationalError as error:
+                    errors.append(error)
+            connections["tuned"].close()
+
+        threads = [
+            threading.Thread(target=worker, args=(number,))
+            for number in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            Group.objects.using("tuned").count(), self.THREADS * self.WRITES
+        )
+
+
+class ImportExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command(
+            "generate_data", users=8, groups=2, posts=30, comments=20,
+            follows=2, stdout=StringIO(),
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, "content.ndjson")
+        call_command("export_content", output=self.path, stdout=StringIO())
+
+    def clear(self):
+        for model in (Follow, Comment, Post, User, Group):
+            model.objects.all().delete()
+
+    def snapshot(self):
+        return (
+            sorted(User.objects.values_list("username", flat=True)),
+            sorted(Post.objects.values_list(
+                "pub_date", "author__username", "text", "group__slug"
+            )),
+            sorted(Comment.objects.values_list(
+                "post__pub_date", "post__text", "author__username", "created"
+            )),
+            sorted(Follow.objects.values_list(
+                "user__username", "author__username"
+            )),
+        )
+
+    def test_round_trip(self):
+        before = self.snapshot()
+        self.clear()
+        call_command("import_content", self.path, stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(
+            sum(Post.objects.values_list("comment_count", flat=True)), 20
+        )
+        self.assertFalse(os.path.exists(self.path + ".progress"))
+        call_command("import_content", self.path, stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+
+    def test_source_ids_taken_by_other_posts(self):
+        before = self.snapshot()
+        with open(self.path) as source:
+            records = [json.loads(line) for line in source]
+        self.clear()
+        local = User.objects.create_user(username="local")
+        for record in records:
+            if record["type"] == "post":
+                Post.objects.create(pk=record["id"], author=local, text="own")
+        importer = Importer()
+        importer.run(records)
+        own = Post.objects.filter(author=local)
+        self.assertEqual(own.count(), 30)
+        self.assertFalse(Comment.objects.filter(post__in=own).exists())
+        local.delete()
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(importer.written, len(records))
+        importer = Importer()
+        importer.run(records)
+        self.assertEqual(importer.written, 0)
+        self.assertEqual(importer.skipped, len(records))
+
+    def test_import_keeps_other_scores(self):
+        Comment.objects.update(created=timezone.now())
+        call_command("export_content", output=self.path, stdout=StringIO())
+        self.clear()
+        author = User.objects.create_user(username="local")
+        reader = User.objects.create_user(username="local.reader")
+        post = Post.objects.create(author=author, text="own")
+        Follow.objects.create(user=reader, author=author)
+        score = PostScore.objects.get(pk=post.pk).score
+        call_command("import_content", self.path, stdout=StringIO())
+        self.assertEqual(PostScore.objects.get(pk=post.pk).score, score)
+        imported = set(PostScore.objects.exclude(pk=post.pk).values_list(
+            "pk", flat=True
+        ))
+        self.assertTrue(imported)
+        trending.rebuild()
+        self.assertEqual(
+            imported, set(PostScore.objects.values_list("pk", flat=True))
+        )
+
+    def test_resume_skips_committed_records(self):
+        with open(self.path) as source:
+            records = [json.loads(line) for line in source]
+        self.clear()
+        with open(self.path + ".progress", "w") as progress:
+            progress.write(str(len(records) - 5))
+        call_command(
+            "import_content", self.path, resume=True, stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertEqual(Follow.objects.count(), 5)
+
+    def test_resume_maps_posts_before_the_resume_point(self):
+        before = self.snapshot()
+        with open(self.path) as source:
+            records = [json.loads(line) for line in source]
+        first_comment = next(
+            number for number, record in enumerate(records)
+            if record["type"] == "comment"
+        )
+        self.clear()
+        Importer().run(records[:first_comment])
+        importer = Importer(batch_size=7)
+        importer.run(records, skip=first_comment)
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(importer.skipped, 0)
+
+    def test_csv(self):
+        path = os.path.join(self.directory, "posts.csv")
+        call_command(
+            "export_content", output=path, format="csv", types=["post"],
+            stdout=StringIO(),
+        )
+        texts = sorted(Post.objects.values_list("text", flat=True))
+        Post.objects.all().delete()
+        call_command(
+            "import_content", path, type="post", batch_size=7,
+            no_rebuild=True, stdout=StringIO(),
+        )
+        self.assertEqual(
+            sorted(Post.objects.values_list("text", flat=True)), texts
+        )
+        with self.assertRaises(CommandError):
+            call_command("import_content", path, stdout=StringIO())
+
+    def test_csv_comments_after_posts(self):
+        before = self.snapshot()
+        paths = {}
+        for record_type in ("post", "comment"):
+            paths[record_type] = os.path.join(
+                self.directory, "%ss.csv" % record_type
+            )
+            call_command(
+                "export_content", output=paths[record_type], format="csv",
+                types=[record_type], stdout=StringIO(),
+            )
+        Post.objects.all().delete()
+        for record_type in ("post", "comment"):
+            out = StringIO()
+            call_command(
+                "import_content", paths[record_type], type=record_type,
+                no_rebuild=True, stdout=out,
+            )
+        self.assertIn("20 written, 0 skipped", out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+
+
+class CardRendererTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="card.user+1@x")
+        self.group = Group.objects.create(
+            slug="cards", title="cards", description="cards"
+        )
+        self.posts = [
+            Post.objects.create(
+                author=self.user, text="one", group=self.group
+            ),
+            Post.objects.create(author=self.user, text="two"),
+        ]
+
+    def test_url_pattern_matches_reverse(self):
+        pattern = cards.url_pattern("post", 2)
+        for username, post_id in (("a.b+c@d", 1), ("user", 123456)):
+            self.assertEqual(
+                pattern(username, post_id),
+                reverse("post", args=[username, post_id]),
+            )
+
+    def test_batch_renders_card_links(self):
+        response = self.client.get(reverse("index"))
+        for post in self.posts:
+            self.assertContains(
+                response, reverse("post", args=[self.user.username, post.id])
+            )
+        self.assertContains(response, 'href="%s"' % reverse(
+            "profile", args=[self.user.username]
+        ), count=2)
+        self.assertContains(
+            response, reverse("group_posts", args=[self.group.slug]), count=1
+        )
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, reverse(
+            "post_edit", args=[self.user.username, self.posts[0].id]
+        ))
+
+    def test_benchmark_templates(self):
+        out = StringIO()
+        call_command(
+            "benchmark_templates", sizes=[2], repeat=1, stdout=out
+        )
+        self.assertIn("batch ms", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command(
+                "benchmark_templates", sizes=[3], repeat=1, stdout=out
+            )
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentThreadTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.post = Post.objects.create(author=self.author, text="post")
+        for number in range(7):
+            user = User.objects.create_user(username="reader%s" % number)
+            Comment.objects.create(
+                post=self.post, author=user, text="comment %s" % number
+            )
+        self.args = [self.author.username, self.post.id]
+
+    def comment_texts(self, content):
+        return re.findall(r"comment \d", content.decode())
+
+    def test_post_page_shows_first_chunk(self):
+        with self.assertQueryBudget(8, repeat_threshold=3):
+            response = self.client.get(reverse("post", args=self.args))
+        self.assertEqual(
+            self.comment_texts(response.content),
+            ["comment 0", "comment 1", "comment 2"],
+        )
+        self.assertContains(response, "comments-more")
+
+    def test_fragments_load_the_rest(self):
+        response = self.client.get(reverse("post", args=self.args))
+        texts = self.comment_texts(response.content)
+        url = response.context["comment"].next_cursor
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    reverse("post_comments", args=self.args),
+                    {"cursor": url},
+                )
+            texts += self.comment_texts(response.content)
+            url = response.context["items"].next_cursor
+        self.assertEqual(texts, ["comment %s" % n for n in range(7)])
+        self.assertNotContains(response, "comments-more")
+        self.assertNotContains(response, "<html")
+
+    def test_api_comments(self):
+        url = reverse("api:post_comments", args=self.args)
+        data = json.loads(self.client.get(url).content)
+        self.assertEqual(
+            [row["author_username"] for row in data["results"]],
+            ["reader0", "reader1", "reader2"],
+        )
+        data = json.loads(
+            self.client.get(url, {"cursor": data["next"]}).content
+        )
+        self.assertEqual(data["results"][0]["text"], "comment 3")
+        data = json.loads(
+            self.client.get(reverse("api:post", args=self.args)).content
+        )
+        self.assertEqual(len(data["comments"]), 3)
+        self.assertIsNotNone(data["comments_next"])
+
+
+CALLS = []
+
+
+@tasks.task(priority=1)
+def record_call(value):
+    CALLS.append(value)
+
+
+@tasks.task(max_attempts=2)
+def always_fails():
+    raise ValueError("broken")
+
+
+@tasks.task(max_attempts=1)
+def write_then_fail(username):
+    User.objects.create(username=username)
+    db.run_write(User.objects.create, username=username + ".nested")
+    if not username.startswith("ok"):
+        raise ValueError("broken")
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTest(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+        cache.clear()
+
+    def run_worker(self, **options):
+        out = StringIO()
+        call_command("run_tasks", burst=True, stdout=out, **options)
+        return out.getvalue()
+
+    def test_eager_runs_inline(self):
+        with self.settings(TASKS_EAGER=True):
+            tasks.enqueue(record_call, 1)
+        self.assertEqual(CALLS, [1])
+        self.assertFalse(Job.objects.exists())
+
+    def test_keys_fold_queued_jobs(self):
+        tasks.enqueue(record_call, 1, key="same")
+        tasks.enqueue(record_call, 2, key="same")
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(tasks.claim(10, "worker"), [Job.objects.get().pk])
+        tasks.enqueue(record_call, 3, key="same")
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_priority_order(self):
+        tasks.enqueue(record_call, "low", priority=-1)
+        tasks.enqueue(record_call, "default")
+        tasks.enqueue(record_call, "high", priority=5)
+        self.assertIn("3 jobs done", self.run_worker(workers=1))
+        self.assertEqual(CALLS, ["high", "default", "low"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_retries_then_fails(self):
+        tasks.enqueue(always_fails)
+        with self.settings(TASKS_RETRY_BACKOFF=0):
+            self.assertIn("2 attempts failed", self.run_worker())
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn("broken", job.last_error)
+
+    def test_backoff_delays_retry(self):
+        tasks.enqueue(always_fails)
+        self.run_worker()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(tasks.claim(10, "worker"), [])
+
+    def test_job_writes_commit_with_the_job(self):
+        tasks.enqueue(write_then_fail, "ok")
+        tasks.enqueue(write_then_fail, "failing")
+        self.run_worker(workers=2)
+        self.assertEqual(
+            sorted(User.objects.values_list("username", flat=True)),
+            ["ok", "ok.nested"],
+        )
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_stale_jobs_are_reclaimed(self):
+        tasks.enqueue(record_call, 1)
+        tasks.claim(10, "dead")
+        Job.objects.update(
+            locked_at=timezone.now() - timedelta(seconds=3600)
+        )
+        self.run_worker()
+        self.assertEqual(CALLS, [1])
+
+    def test_follow_side_effects_run_in_worker(self):
+        author = User.objects.create_user(username="author")
+        reader = User.objects.create_user(username="reader")
+        Post.objects.create(author=author, text="text")
+        Follow.objects.create(user=reader, author=author)
+        self.assertFalse(TimelineEntry.objects.filter(user=reader).exists())
+        self.assertTrue(Job.objects.filter(
+            name="posts.timeline.backfill"
+        ).exists())
+        self.run_worker(workers=2)
+        self.assertTrue(TimelineEntry.objects.filter(user=reader).exists())
+        self.assertEqual(search.search("text").object_list[0].author, author)
+
+
+class NotificationTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.readers = [
+            User.objects.create_user(
+                username="reader%s" % number,
+                email="reader%s@example.com" % number if number else "",
+            )
+            for number in range(3)
+        ]
+        for reader in self.readers:
+            Follow.objects.create(user=reader, author=self.author)
+        self.client.force_login(self.readers[1])
+
+    def unread(self):
+        response = self.client.get(reverse("api:unread_notifications"))
+        return json.loads(response.content)["unread"]
+
+    def test_fan_out_in_batches(self):
+        with self.settings(NOTIFICATION_BATCH_SIZE=2):
+            post = Post.objects.create(author=self.author, text="new post")
+        self.assertEqual(
+            set(Notification.objects.values_list("user_id", "post_id")),
+            {(reader.pk, post.pk) for reader in self.readers},
+        )
+        self.assertEqual(notifications.fan_out(post.pk), 3)
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_unread_count_is_cached(self):
+        self.assertEqual(self.unread(), 0)
+        Post.objects.create(author=self.author, text="one")
+        Post.objects.create(author=self.author, text="two")
+        self.assertEqual(self.unread(), 2)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.unread(), 2)
+        response = self.client.get(reverse("notifications"))
+        self.assertContains(response, "Непрочитанных: 2")
+        self.assertContains(response, "two")
+        self.client.post(reverse("notifications_read"))
+        self.assertEqual(self.unread(), 0)
+        self.client.logout()
+        self.assertEqual(
+            self.client.get(reverse("api:unread_notifications")).status_code,
+            401,
+        )
+
+    def test_unread_cache_is_dropped_after_commit(self):
+        self.assertEqual(self.unread(), 0)
+        key = notifications.UNREAD_KEY % self.readers[1].pk
+        with transaction.atomic():
+            Post.objects.create(author=self.author, text="one")
+            self.assertEqual(cache.get(key), 0)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(self.unread(), 1)
+
+    def test_digest_bundles_posts(self):
+        for number in range(3):
+            Post.objects.create(author=self.author, text="post %s" % number)
+        notifications.mark_read(self.readers[2].pk)
+        with self.settings(NOTIFICATION_DIGEST_MAX_POSTS=2):
+            out = StringIO()
+            call_command("send_digests", stdout=out)
+        self.assertIn("1 digests sent", out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ["reader1@example.com"])
+        self.assertIn("post 2", message.body)
+        self.assertNotIn("post 0", message.body)
+        self.assertIn("3", message.subject)
+        call_command("send_digests", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_digest_of_notifications_read_meanwhile(self):
+        Post.objects.create(author=self.author, text="post")
+        select_related = QuerySet.select_related
+
+        def read_first(queryset, *fields):
+            Notification.objects.update(read=True)
+            return select_related(queryset, *fields)
+
+        with mock.patch.object(QuerySet, "select_related", read_first):
+            self.assertEqual(notifications.send_digests(), 0)
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.reader = User.objects.create_user(username="reader")
+        self.old = Post.objects.create(author=self.author, text="old post")
+        self.new = Post.objects.create(author=self.author, text="new post")
+
+    def comment(self, post):
+        return Comment.objects.create(
+            post=post, author=self.reader, text="comment"
+        )
+
+    def ranking(self):
+        cache.clear()
+        page = trending.get_page(None, 10)
+        return [post.id for post in page]
+
+    def test_comments_rank_posts(self):
+        self.comment(self.old)
+        self.comment(self.old)
+        self.comment(self.new)
+        self.assertEqual(self.ranking(), [self.old.id, self.new.id])
+        response = self.client.get(reverse("popular"))
+        self.assertEqual(
+            [post.id for post in response.context["page"]],
+            [self.old.id, self.new.id],
+        )
+        response = self.client.get(reverse("api:popular"))
+        self.assertEqual(
+            [row["id"] for row in json.loads(response.content)["results"]],
+            [self.old.id, self.new.id],
+        )
+
+    def test_newer_activity_outweighs_decayed_activity(self):
+        started = trending.current_epoch().started
+        later = started + timedelta(seconds=2 * settings.TRENDING_HALF_LIFE)
+        for _ in range(3):
+            trending.add(self.old.id, 1.0, started)
+        trending.add(self.new.id, 1.0, later)
+        self.assertEqual(self.ranking(), [self.new.id, self.old.id])
+
+    def test_deleted_comment_is_subtracted(self):
+        comment = self.comment(self.new)
+        self.comment(self.old)
+        comment.delete()
+        self.assertEqual(self.ranking(), [self.old.id])
+
+    def test_follow_credits_latest_post(self):
+        self.comment(self.old)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.ranking(), [self.new.id, self.old.id])
+
+    def test_compact_rebases_and_drops_decayed_scores(self):
+        now = timezone.now()
+        TrendingEpoch.objects.update(
+            started=now - timedelta(seconds=10 * settings.TRENDING_HALF_LIFE)
+        )
+        trending.add(self.old.id, 1.0, now - timedelta(
+            seconds=10 * settings.TRENDING_HALF_LIFE
+        ))
+        trending.add(self.new.id, 1.0, now)
+        out = StringIO()
+        call_command("compact_trending", stdout=out)
+        self.assertIn("Kept 1 scores, removed 1", out.getvalue())
+        self.assertAlmostEqual(
+            PostScore.objects.get(pk=self.new.id).score, 1.0, places=2
+        )
+        self.assertEqual(self.ranking(), [self.new.id])
+
+    def test_rebuild_and_pagination(self):
+        for _ in range(2):
+            self.comment(self.old)
+        self.comment(self.new)
+        PostScore.objects.all().delete()
+        call_command("compact_trending", "--rebuild", stdout=StringIO())
+        self.assertEqual(self.ranking(), [self.old.id, self.new.id])
+        first = trending.get_page(None, 1)
+        self.assertEqual([post.id for post in first], [self.old.id])
+        second = trending.get_page(first.next_cursor, 1)
+        self.assertEqual([post.id for post in second], [self.new.id])
+        self.assertEqual(
+            [post.id for post in trending.get_page(second.previous_cursor, 1)],
+            [self.old.id],
+        )
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_trending", posts=20, repeat=3, stdout=out
+        )
+        self.assertIn("top 11, cached", out.getvalue())
+        self.assertFalse(Post.objects.filter(text="benchmark").exists())
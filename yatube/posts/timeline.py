@@ -0,0 +1,156 @@
+"""Materialized follow feed.
+
+Posts are copied into the timeline of every follower when they are
+written. Authors with more than ``FOLLOW_TIMELINE_FANOUT_LIMIT``
+followers are skipped on write and merged into the feed on read instead.
+Both sides go by UserStats.followers_count, so they agree on who is
+skipped; an author who drops back to the limit has their posts
+backfilled into the followers' timelines.
+"""
+from django.conf import settings
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .pagination import CursorPaginator
+from .tasks import task
+
+BATCH_SIZE = 500
+
+
+def fanout_limit():
+    return settings.FOLLOW_TIMELINE_FANOUT_LIMIT
+
+
+def is_celebrity(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id, followers_count__gt=fanout_limit()
+    ).exists()
+
+
+def followed_celebrities(user_id):
+    return Follow.objects.filter(
+        user_id=user_id, author__stats__followers_count__gt=fanout_limit()
+    ).values_list("author_id", flat=True)
+
+
+def just_demoted(author_id):
+    """Whether the author's last unfollow took them down to the limit."""
+    return UserStats.objects.filter(
+        user_id=author_id, followers_count=fanout_limit()
+    ).exists()
+
+
+def _create_entries(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+@task(priority=10)
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).only(
+        "id", "author_id", "pub_date"
+    ).first()
+    if post is not None:
+        fan_out(post)
+
+
+def fan_out(post):
+    if is_celebrity(post.author_id):
+        return
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list("user_id", flat=True))
+    _create_entries(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers
+    )
+
+
+@task(priority=10)
+def backfill(user_id, author_id):
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        "id", "pub_date"
+    )
+    _create_entries(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+@task(priority=10)
+def backfill_followers(author_id):
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True
+    )
+    for user_id in list(followers):
+        backfill(user_id, author_id)
+
+
+@task(priority=10)
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(user_id=user_id).exclude(
+        author_id__in=followed_celebrities(user_id)
+    ).values_list("author_id", flat=True)
+    for author_id in list(authors):
+        backfill(user_id, author_id)
+
+
+def get_page(user, cursor, per_page, post_list=None):
+    sources = [
+        CursorPaginator(
+            TimelineEntry.objects.filter(user=user).values_list(
+                "pub_date", "post_id"
+            ),
+            per_page,
+            ordering=("-pub_date", "-post_id"),
+        ),
+    ]
+    followed = list(followed_celebrities(user.pk))
+    if followed:
+        sources.append(CursorPaginator(
+            Post.objects.filter(author_id__in=followed).values_list(
+                "pub_date", "id"
+            ),
+            per_page,
+        ))
+    merged = {}
+    has_cursor = backwards = False
+    for paginator in sources:
+        queryset, has_cursor, backwards = paginator.cursor_queryset(cursor)
+        merged.update(
+            (post_id, pub_date)
+            for pub_date, post_id in queryset[:per_page + 1]
+        )
+    keys = sorted(
+        ((pub_date, post_id) for post_id, pub_date in merged.items()),
+        reverse=not backwards,
+    )[:per_page + 1]
+    if post_list is None:
+        post_list = Post.objects.for_feed()
+    posts = {
+        row["id"] if isinstance(row, dict) else row.id: row
+        for row in post_list.filter(
+            pk__in=[post_id for _, post_id in keys]
+        ).order_by()
+    }
+    rows = [posts[post_id] for _, post_id in keys if post_id in posts]
+    return CursorPaginator(Post.objects.none(), per_page).build_page(
+        rows, has_cursor, backwards
+    )
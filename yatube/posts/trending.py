@@ -0,0 +1,204 @@
+"""Popular feed ranked by decayed comment and follow activity.
+
+A post's score is the sum of its events, each worth its weight halved
+every TRENDING_HALF_LIFE seconds. Instead of decaying every row as time
+passes, an event at time t adds weight * 2 ** ((t - epoch) / half_life)
+to the stored score: later events count for more, which orders posts
+exactly as the decayed sums would, so the ranking is a plain index scan
+on PostScore.score and each event is a single UPDATE.
+
+The stored numbers grow with time since the epoch. The compact_trending
+command moves the epoch to now, scales the scores down to match and
+drops the rows that have decayed below TRENDING_MIN_SCORE.
+
+A new follower credits the author's latest post. Comments written in
+bulk, which send no signals, are credited with comments_added().
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Comment, Post, PostScore, TrendingEpoch
+from .pagination import CursorPaginator
+
+TOP_KEY = "trending:top:%s"
+BATCH_SIZE = 500
+# Compact on write if the cron job has not run for this many half-lives,
+# long before the stored scores could overflow.
+REBASE_LIMIT = 512
+
+
+def current_epoch():
+    epoch = TrendingEpoch.objects.order_by("pk").first()
+    if epoch is None:
+        epoch, _ = TrendingEpoch.objects.get_or_create(
+            pk=1, defaults={"started": timezone.now()}
+        )
+    return epoch
+
+
+def half_lives(since, until):
+    return (until - since).total_seconds() / settings.TRENDING_HALF_LIFE
+
+
+def horizon():
+    """Seconds after which a comment is worth less than the minimum."""
+    return settings.TRENDING_HALF_LIFE * math.log2(
+        settings.TRENDING_COMMENT_WEIGHT / settings.TRENDING_MIN_SCORE
+    )
+
+
+def epoch_for(when):
+    epoch = current_epoch()
+    if half_lives(epoch.started, when) > REBASE_LIMIT:
+        compact()
+        epoch = current_epoch()
+    return epoch
+
+
+def add(post_id, weight, when=None):
+    when = when or timezone.now()
+    epoch = epoch_for(when)
+    credit(post_id, weight * 2 ** half_lives(epoch.started, when))
+
+
+def credit(post_id, value):
+    scores = PostScore.objects.filter(pk=post_id)
+    if scores.update(score=F("score") + value) or value <= 0:
+        return
+    _, created = PostScore.objects.get_or_create(
+        post_id=post_id, defaults={"score": value}
+    )
+    if not created:
+        scores.update(score=F("score") + value)
+
+
+def comment_added(comment):
+    add(comment.post_id, settings.TRENDING_COMMENT_WEIGHT, comment.created)
+
+
+def comment_removed(comment):
+    # The same value the comment added, so a deleted comment leaves
+    # no trace in the ranking.
+    add(comment.post_id, -settings.TRENDING_COMMENT_WEIGHT, comment.created)
+
+
+def comments_added(comments):
+    """Credit comments written without signals, as (post_id, created).
+
+    Unlike rebuild(), this leaves the other posts' scores alone.
+    """
+    since = timezone.now() - timedelta(seconds=horizon())
+    comments = [
+        (post_id, created) for post_id, created in comments
+        if created >= since
+    ]
+    if not comments:
+        return
+    epoch = epoch_for(max(created for _, created in comments))
+    totals = defaultdict(float)
+    for post_id, created in comments:
+        totals[post_id] += settings.TRENDING_COMMENT_WEIGHT * 2 ** (
+            half_lives(epoch.started, created)
+        )
+    for post_id, value in totals.items():
+        credit(post_id, value)
+
+
+def author_followed(author_id):
+    post_id = Post.objects.filter(author_id=author_id).order_by(
+        "-pub_date", "-id"
+    ).values_list("id", flat=True).first()
+    if post_id is not None:
+        add(post_id, settings.TRENDING_FOLLOW_WEIGHT)
+
+
+def compact():
+    now = timezone.now()
+    with transaction.atomic():
+        epoch = current_epoch()
+        exponent = -half_lives(epoch.started, now)
+        scores = PostScore.objects.all()
+        if exponent < math.log2(settings.TRENDING_MIN_SCORE) - REBASE_LIMIT:
+            removed, _ = scores.delete()
+        else:
+            factor = 2 ** exponent
+            removed, _ = scores.filter(
+                score__lt=settings.TRENDING_MIN_SCORE / factor
+            ).delete()
+            scores.update(score=F("score") * factor)
+        epoch.started = now
+        epoch.save(update_fields=["started"])
+    return scores.count(), removed
+
+
+def rebuild():
+    """Recompute the scores from the comments that still count."""
+    now = timezone.now()
+    totals = defaultdict(float)
+    comments = Comment.objects.filter(
+        created__gte=now - timedelta(seconds=horizon())
+    ).order_by().values_list("post_id", "created")
+    for post_id, created in comments.iterator():
+        totals[post_id] += settings.TRENDING_COMMENT_WEIGHT * 2 ** (
+            half_lives(now, created)
+        )
+    with transaction.atomic():
+        PostScore.objects.all().delete()
+        TrendingEpoch.objects.all().delete()
+        TrendingEpoch.objects.create(pk=1, started=now)
+        PostScore.objects.bulk_create(
+            (PostScore(post_id=post_id, score=score)
+             for post_id, score in totals.items()
+             if score >= settings.TRENDING_MIN_SCORE),
+            batch_size=BATCH_SIZE,
+        )
+    return PostScore.objects.count()
+
+
+def ranked(limit, cursor=None):
+    rows = PostScore.objects.filter(score__gt=0).values("score", "post_id")
+    paginator = CursorPaginator(
+        rows, limit, ordering=("-score", "-post_id")
+    )
+    queryset, has_cursor, backwards = paginator.cursor_queryset(cursor)
+    return list(queryset[:limit]), has_cursor, backwards
+
+
+def top(limit):
+    """The best ``limit`` score rows, cached for TRENDING_CACHE_TIMEOUT."""
+    key = TOP_KEY % limit
+    rows = cache.get(key)
+    if rows is None:
+        rows, _, _ = ranked(limit)
+        cache.set(key, rows, settings.TRENDING_CACHE_TIMEOUT)
+    return rows
+
+
+def get_page(cursor, per_page, post_list=None):
+    paginator = CursorPaginator(
+        PostScore.objects.none(), per_page, ordering=("-score", "-post_id")
+    )
+    if cursor:
+        rows, has_cursor, backwards = ranked(per_page + 1, cursor)
+    else:
+        rows, has_cursor, backwards = top(per_page + 1), False, False
+    page = paginator.build_page(rows, has_cursor, backwards)
+    if post_list is None:
+        post_list = Post.objects.for_feed()
+    posts = {
+        row["id"] if isinstance(row, dict) else row.id: row
+        for row in post_list.filter(
+            pk__in=[row["post_id"] for row in page]
+        ).order_by()
+    }
+    page.object_list = [
+        posts[row["post_id"]] for row in page if row["post_id"] in posts
+    ]
+    return page
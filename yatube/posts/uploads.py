@@ -0,0 +1,64 @@
+"""Upload handler that streams files to disk and stops at the limits.
+
+Views wrapped in limited_image_uploads send every upload to a temporary
+file, never to memory. Once a file grows past POST_IMAGE_MAX_BYTES, or
+its header announces more than POST_IMAGE_MAX_PIXELS pixels, the rest
+of it is discarded and the file is flagged so that the form rejects it.
+Other uploads on the site keep Django's default handlers.
+"""
+import io
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+
+def header_size(data):
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+class LimitedImageUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file.size_exceeded = False
+        self.file.pixels_exceeded = False
+        self.header = b""
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file.size_exceeded or self.file.pixels_exceeded:
+            return None
+        if start + len(raw_data) > settings.POST_IMAGE_MAX_BYTES:
+            self.file.size_exceeded = True
+            return None
+        if self.header is not None:
+            self.header += raw_data
+            size = header_size(self.header)
+            if size is not None:
+                self.header = None
+                width, height = size
+                if width * height > settings.POST_IMAGE_MAX_PIXELS:
+                    self.file.pixels_exceeded = True
+                    return None
+            elif len(self.header) >= 256 * 1024:
+                self.header = None
+        self.file.write(raw_data)
+        return None
+
+
+def limited_image_uploads(view):
+    # The CSRF middleware reads request.POST, after which the handlers
+    # can no longer change, so the check moves inside the view.
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers.insert(0, LimitedImageUploadHandler(request))
+        return protected(request, *args, **kwargs)
+    return wrapper
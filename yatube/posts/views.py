@@ -1,37 +1,50 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_POST, require_safe
 
+from yatube.db import run_write
+
+from . import counters, images, notifications, search, timeline, trending
+from .conditional import (
+    conditional_page, group_state, post_state, profile_state,
+)
 from .forms import PostForm, CommentForm
-from .models import Group, Post, User, Comment, Follow
+from .models import Group, Post, User, Comment, Follow, Notification
+from .page_cache import generation_cache_page
+from .pagination import CursorPaginator
+from .uploads import limited_image_uploads
 
 
-@cache_page(20)
+@generation_cache_page("index")
 def index(request):
-    post_list = Post.objects.order_by("-pub_date").all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    return render(request, "index.html",
-                  {"page": page, "paginator": paginator})
+    post_list = Post.objects.for_feed()
+    paginator = CursorPaginator(post_list, 10)
+    page = paginator.get_page(request.GET.get("cursor"))
+    return render(request, "index.html", {"page": page})
 
 
+@conditional_page(group_state)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = group.posts.for_feed()
+    paginator = CursorPaginator(posts, 10)
+    page = paginator.get_page(request.GET.get("cursor"))
     return render(request, "group.html",
                   {
                       "group": group,
                       "posts": posts,
                       "page": page,
-                      "paginator": paginator
                   })
 
 
+def search_posts(request):
+    query = request.GET.get("q", "").strip()
+    page = search.search(query, request.GET.get("cursor"))
+    return render(request, "search.html", {"page": page, "query": query})
+
+
+@limited_image_uploads
 @login_required
 def new_post(request):
     form = PostForm(request.POST, files=request.FILES or None)
@@ -42,17 +55,21 @@ def new_post(request):
         return render(request, "new.html", {"form": form})
     post_get = form.save(commit=False)
     post_get.author = request.user
-    post_get.save()
+    run_write(post_get.save)
+    if post_get.image:
+        images.schedule_processing(post_get.id)
     return redirect("index")
 
 
+@conditional_page(profile_state)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_count = Post.objects.filter(author=author).count()
-    post_list = Post.objects.filter(author=author).order_by("-pub_date")
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related("stats"), username=username
+    )
+    post_count = counters.user_stats(author).posts_count
+    post_list = author.posts.for_feed()
+    paginator = CursorPaginator(post_list, 10)
+    page = paginator.get_page(request.GET.get("cursor"))
     if request.user.is_anonymous:
         following = None
     else:
@@ -60,26 +77,53 @@ def profile(request, username):
     return render(request, "profile.html",
                   {
                       "page": page,
-                      "paginator": paginator,
                       "post_count": post_count,
                       "following": following,
                       "author": author
                   })
 
 
+@conditional_page(post_state)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, id=post_id)
+    post = get_object_or_404(
+        Post.objects.for_feed().select_related("author__stats"),
+        author__username=username,
+        id=post_id,
+    )
+    counters.user_stats(post.author)
     form = CommentForm()
-    comment = Comment.objects.filter(post_id=post_id)
+    comments = comment_page(post.id, request.GET.get("cursor"))
     return render(request, "post.html",
                   {
                       "author": post.author,
                       "post": post,
                       "form": form,
-                      "comment": comment
+                      "comment": comments
                   })
 
 
+def comment_page(post_id, cursor):
+    comments = Comment.objects.filter(post_id=post_id).for_thread()
+    paginator = CursorPaginator(
+        comments, settings.COMMENTS_PER_PAGE, ordering=("created", "id")
+    )
+    return paginator.get_page(cursor)
+
+
+@require_safe
+@conditional_page(post_state)
+def post_comments(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.only("id", "author__username").select_related("author"),
+        author__username=username,
+        id=post_id,
+    )
+    comments = comment_page(post.id, request.GET.get("cursor"))
+    return render(request, "includes/comment_list.html",
+                  {"post": post, "items": comments})
+
+
+@limited_image_uploads
 @login_required
 def post_edit(request, username, post_id):
     profile = get_object_or_404(User, username=username)
@@ -91,6 +135,8 @@ def post_edit(request, username, post_id):
     if request.method == "POST":
         if form.is_valid():
             form.save()
+            if "image" in form.changed_data:
+                images.schedule_processing(post.id)
             return redirect("post", username=request.user.username,
                             post_id=post_id)
 
@@ -112,7 +158,7 @@ def add_comment(request, username, post_id):
     comment = form.save(commit=False)
     comment.author = request.user
     comment.post = post
-    comment.save()
+    run_write(comment.save)
     return redirect("post", username=username,
                     post_id=post_id)
 
@@ -132,12 +178,40 @@ def server_error(request):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    return render(request, "follow.html",
-                  {"page": page, "paginator": paginator})
+    cursor = request.GET.get("cursor")
+    if settings.FOLLOW_TIMELINE_ENABLED:
+        page = timeline.get_page(request.user, cursor, 10)
+    else:
+        post_list = Post.objects.filter(
+            author__following__user=request.user
+        ).for_feed()
+        page = CursorPaginator(post_list, 10).get_page(cursor)
+    return render(request, "follow.html", {"page": page})
+
+
+def popular(request):
+    page = trending.get_page(request.GET.get("cursor"), 10)
+    return render(request, "popular.html", {"page": page})
+
+
+@login_required
+def notification_list(request):
+    items = Notification.objects.filter(user=request.user).select_related(
+        "post__author"
+    )
+    paginator = CursorPaginator(items, 20, ordering=("-id",))
+    page = paginator.get_page(request.GET.get("cursor"))
+    return render(request, "notifications.html", {
+        "page": page,
+        "unread": notifications.unread_count(request.user.id),
+    })
+
+
+@login_required
+@require_POST
+def notifications_read(request):
+    run_write(notifications.mark_read, request.user.id)
+    return redirect("notifications")
 
 
 @login_required
@@ -145,12 +219,16 @@ def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author == request.user:
         return redirect("profile", username=username)
-    Follow.objects.get_or_create(user=request.user, author=author)
+    run_write(
+        Follow.objects.get_or_create, user=request.user, author=author
+    )
     return redirect("profile", username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    run_write(
+        Follow.objects.filter(user=request.user, author=author).delete
+    )
     return redirect("profile", username=username)
@@ -0,0 +1,26 @@
+"""SQLite backend tuned for concurrent readers and writers.
+
+Every new connection applies SQLITE_PRAGMAS (WAL, synchronous=NORMAL,
+mmap, cache size and busy timeout). While begin_immediate is set,
+transactions start with BEGIN IMMEDIATE and take the write lock up
+front. A deferred transaction that reads and then writes can instead
+fail at once with "database is locked".
+"""
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    begin_immediate = False
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            connection.execute("PRAGMA %s = %s" % (name, value))
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        if self.begin_immediate:
+            self.cursor().execute("BEGIN IMMEDIATE")
+        else:
+            super()._start_transaction_under_autocommit()
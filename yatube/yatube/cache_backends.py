@@ -0,0 +1,157 @@
+"""Two-tier cache: a small in-process LRU in front of a shared backend.
+
+Values read from the shared backend are kept locally for LOCAL_TIMEOUT
+seconds. Every write also appends the key to an invalidation log in the
+shared backend; each process replays that log at most once per
+SYNC_INTERVAL and evicts the keys other processes have changed.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+SEQUENCE_KEY = "twotier:sequence"
+LOG_KEY = "twotier:log:%s"
+LOG_TIMEOUT = 300
+MAX_REPLAY = 1000
+
+_stores = {}
+_stores_lock = threading.Lock()
+_missing = object()
+
+
+class LocalStore:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.seen = None
+        self.next_sync = 0
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        shared = dict(options["SHARED"])
+        shared.setdefault("KEY_PREFIX", params.get("KEY_PREFIX", ""))
+        backend = import_string(shared["BACKEND"])
+        self.shared = backend(shared.get("LOCATION", ""), shared)
+        self.local_max_entries = options.get("LOCAL_MAX_ENTRIES", 1000)
+        self.local_timeout = options.get("LOCAL_TIMEOUT", 5)
+        self.sync_interval = options.get("SYNC_INTERVAL", 0.5)
+        with _stores_lock:
+            self.store = _stores.setdefault(name, LocalStore())
+
+    def _sync(self):
+        store = self.store
+        now = time.monotonic()
+        if now < store.next_sync:
+            return
+        store.next_sync = now + self.sync_interval
+        sequence = self.shared.get(SEQUENCE_KEY)
+        if sequence is None or store.seen is None or sequence < store.seen:
+            if store.seen is not None or sequence is None:
+                self._clear_local()
+            store.seen = sequence
+            return
+        if sequence == store.seen:
+            return
+        if sequence - store.seen > MAX_REPLAY:
+            self._clear_local()
+        else:
+            log_keys = [
+                LOG_KEY % number
+                for number in range(store.seen + 1, sequence + 1)
+            ]
+            changed = self.shared.get_many(log_keys)
+            if len(changed) < len(log_keys):
+                self._clear_local()
+            else:
+                with store.lock:
+                    for key in changed.values():
+                        store.entries.pop(key, None)
+        store.seen = sequence
+
+    def _publish(self, key):
+        if self.shared.add(SEQUENCE_KEY, 1, None):
+            sequence = 1
+        else:
+            sequence = self.shared.incr(SEQUENCE_KEY)
+        self.shared.set(LOG_KEY % sequence, key, LOG_TIMEOUT)
+
+    def _get_local(self, key):
+        store = self.store
+        with store.lock:
+            entry = store.entries.get(key)
+            if entry is None:
+                return _missing
+            expires, value = entry
+            if expires <= time.monotonic():
+                del store.entries[key]
+                return _missing
+            store.entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value):
+        store = self.store
+        expires = time.monotonic() + self.local_timeout
+        with store.lock:
+            store.entries[key] = (expires, value)
+            store.entries.move_to_end(key)
+            while len(store.entries) > self.local_max_entries:
+                store.entries.popitem(last=False)
+
+    def _delete_local(self, key):
+        with self.store.lock:
+            self.store.entries.pop(key, None)
+
+    def _clear_local(self):
+        with self.store.lock:
+            self.store.entries.clear()
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        self._sync()
+        value = self._get_local(local_key)
+        if value is not _missing:
+            return value
+        value = self.shared.get(key, _missing, version)
+        if value is _missing:
+            return default
+        self._set_local(local_key, value)
+        return value
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self._set_local(self.make_key(key, version), value)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_key(key, version)
+        self.shared.set(key, value, timeout, version)
+        self._publish(local_key)
+        self._set_local(local_key, value)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        local_key = self.make_key(key, version)
+        self.shared.delete(key, version)
+        self._publish(local_key)
+        self._delete_local(local_key)
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_key(key, version)
+        value = self.shared.incr(key, delta, version)
+        self._publish(local_key)
+        self._set_local(local_key, value)
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        self._clear_local()
+        self.store.seen = None
@@ -0,0 +1,103 @@
+"""Primary/replica routing with read-your-writes stickiness.
+
+GET requests to the views in REPLICA_VIEWS read posts data from a
+random DATABASE_REPLICAS alias; everything else uses the primary. A
+request that writes anything sets a short-lived cookie, which pins the
+client to the primary for REPLICA_PIN_SECONDS so it sees its own post
+or comment even if the replicas lag behind.
+
+The middleware also checks persistent connections (CONN_MAX_AGE) before
+each request and drops the ones the server has closed.
+
+run_write() serializes writes to SQLite within the process and retries
+them with backoff while the database is locked by another process. A
+run_write() inside another one joins the outer transaction.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+PIN_COOKIE = "pin_primary"
+REPLICA_APPS = {"posts"}
+
+_state = threading.local()
+_write_lock = threading.Lock()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (getattr(_state, "use_replica", False)
+                and model._meta.app_label in REPLICA_APPS
+                and settings.DATABASE_REPLICAS):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def run_write(function, *args, using="default", **kwargs):
+    connection = connections[using]
+    # The outer call already holds the lock and retries the whole write.
+    if (connection.vendor != "sqlite"
+            or getattr(_state, "writing", None) == using):
+        with transaction.atomic(using=using):
+            return function(*args, **kwargs)
+    attempts = settings.SQLITE_WRITE_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            with _write_lock:
+                connection.begin_immediate = True
+                _state.writing = using
+                try:
+                    with transaction.atomic(using=using):
+                        return function(*args, **kwargs)
+                finally:
+                    connection.begin_immediate = False
+                    _state.writing = None
+        except OperationalError as error:
+            if "locked" not in str(error) or attempt == attempts - 1:
+                raise
+        delay = settings.SQLITE_WRITE_BACKOFF * 2 ** attempt
+        time.sleep(delay * random.uniform(0.5, 1.5))
+
+
+def check_connections():
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+class DatabaseMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.DATABASE_HEALTH_CHECKS:
+            check_connections()
+        _state.use_replica = False
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.use_replica = False
+        if _state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _state.use_replica = (
+            request.method in ("GET", "HEAD")
+            and request.resolver_match.url_name in settings.REPLICA_VIEWS
+            and PIN_COOKIE not in request.COOKIES
+        )
@@ -0,0 +1,293 @@
+"""Per-view request metrics in Prometheus text format.
+
+A sample of requests, METRICS_SAMPLE_RATE of them, is timed end to end
+together with its database queries. Observations go into in-memory
+histograms labelled by URL name that only cover the last METRICS_WINDOW
+seconds. Staff users can read them at /metrics.
+
+The window moves, so its values can go down: they are exported as
+gauges, buckets included, which histogram_quantile() reads as they are.
+
+Timing template rendering and counting cache lookups means wrapping
+Template.render and the cache backends' get() for the whole process.
+Both are on by default and can be switched off with METRICS_TEMPLATES
+and METRICS_CACHES; nothing is wrapped while sampling is off.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import ExitStack
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import HttpResponse
+from django.template.backends.django import Template
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+SLOTS = 10
+HISTOGRAMS = (
+    ("request_duration_seconds", "Wall time of the request.", TIME_BUCKETS),
+    ("db_queries", "Database queries per request.", COUNT_BUCKETS),
+    ("db_duration_seconds", "Time spent in database queries.", TIME_BUCKETS),
+    ("template_duration_seconds", "Time spent rendering templates.",
+     TIME_BUCKETS),
+)
+TOTALS = (
+    ("cache_hits", "Cache lookups that found a value."),
+    ("cache_misses", "Cache lookups that found nothing."),
+)
+OPTIONAL = {
+    "template_duration_seconds": "METRICS_TEMPLATES",
+    "cache_hits": "METRICS_CACHES",
+    "cache_misses": "METRICS_CACHES",
+}
+
+_local = threading.local()
+_missing = object()
+
+
+class Recorder:
+    def __init__(self):
+        self.db_queries = 0
+        self.db_duration = 0.0
+        self.template_duration = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_duration += time.perf_counter() - start
+
+
+class Histogram:
+    """Bucket counts kept in SLOTS time slots that together span window."""
+
+    def __init__(self, buckets, window):
+        self.buckets = buckets
+        self.slot_length = window / SLOTS
+        self.slots = deque()
+        self.lock = threading.Lock()
+
+    def _current(self, now):
+        start = now - now % self.slot_length
+        if not self.slots or self.slots[-1][0] != start:
+            self.slots.append([start, [0] * (len(self.buckets) + 1), 0.0])
+            while self.slots[0][0] <= start - self.slot_length * SLOTS:
+                self.slots.popleft()
+        return self.slots[-1]
+
+    def observe(self, value):
+        with self.lock:
+            slot = self._current(time.time())
+            slot[1][bisect_left(self.buckets, value)] += 1
+            slot[2] += value
+
+    def snapshot(self):
+        with self.lock:
+            self._current(time.time())
+            counts = [0] * (len(self.buckets) + 1)
+            total = 0.0
+            for _, slot_counts, slot_sum in self.slots:
+                counts = [a + b for a, b in zip(counts, slot_counts)]
+                total += slot_sum
+        return counts, total
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.views = {}
+
+    def _histograms(self, view):
+        with self.lock:
+            histograms = self.views.get(view)
+            if histograms is None:
+                window = settings.METRICS_WINDOW
+                histograms = {
+                    name: Histogram(buckets, window)
+                    for name, _, buckets in HISTOGRAMS
+                }
+                histograms.update(
+                    (name, Histogram((), window)) for name, _ in TOTALS
+                )
+                self.views[view] = histograms
+        return histograms
+
+    def record(self, view, duration, recorder):
+        histograms = self._histograms(view)
+        histograms["request_duration_seconds"].observe(duration)
+        histograms["db_queries"].observe(recorder.db_queries)
+        histograms["db_duration_seconds"].observe(recorder.db_duration)
+        histograms["template_duration_seconds"].observe(
+            recorder.template_duration
+        )
+        histograms["cache_hits"].observe(recorder.cache_hits)
+        histograms["cache_misses"].observe(recorder.cache_misses)
+
+    def render(self):
+        with self.lock:
+            views = sorted(self.views.items())
+        window = " Over the last %s seconds." % settings.METRICS_WINDOW
+        lines = []
+
+        def family(metric, help_text, samples):
+            lines.append("# HELP %s %s%s" % (metric, help_text, window))
+            lines.append("# TYPE %s gauge" % metric)
+            lines.extend(samples)
+
+        for name, help_text, buckets in HISTOGRAMS:
+            if not enabled(name):
+                continue
+            metric = "yatube_%s" % name
+            rows = []
+            for view, histograms in views:
+                counts, total = histograms[name].snapshot()
+                rows.append((view, list(accumulate(counts)), total))
+            family(metric + "_bucket", help_text, [
+                '%s_bucket{view="%s",le="%s"} %s' % (
+                    metric, view, bound, count
+                )
+                for view, cumulative, _ in rows
+                for bound, count in zip(buckets + ("+Inf",), cumulative)
+            ])
+            family(metric + "_sum", help_text, [
+                '%s_sum{view="%s"} %s' % (metric, view, total)
+                for view, _, total in rows
+            ])
+            family(metric + "_count", help_text, [
+                '%s_count{view="%s"} %s' % (metric, view, cumulative[-1])
+                for view, cumulative, _ in rows
+            ])
+        for name, help_text in TOTALS:
+            if not enabled(name):
+                continue
+            metric = "yatube_%s" % name
+            family(metric, help_text, [
+                '%s{view="%s"} %d' % (
+                    metric, view, histograms[name].snapshot()[1]
+                )
+                for view, histograms in views
+            ])
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def enabled(name):
+    setting = OPTIONAL.get(name)
+    return setting is None or getattr(settings, setting)
+
+
+def current_recorder():
+    return getattr(_local, "recorder", None)
+
+
+def _wrap_template_render():
+    render = Template.render
+    if getattr(render, "metrics_wrapped", False):
+        return
+
+    def wrapper(self, context=None, request=None):
+        recorder = current_recorder()
+        if recorder is None:
+            return render(self, context, request)
+        start = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            recorder.template_duration += time.perf_counter() - start
+
+    wrapper.metrics_wrapped = True
+    Template.render = wrapper
+
+
+def _wrap_cache_get(cache_class):
+    get = cache_class.get
+    if getattr(get, "metrics_wrapped", False):
+        return
+
+    def wrapper(self, key, default=None, version=None):
+        recorder = current_recorder()
+        if recorder is None:
+            return get(self, key, default, version)
+        # Backends that delegate to another one are counted once.
+        recorder.cache_depth += 1
+        try:
+            value = get(self, key, _missing, version)
+        finally:
+            recorder.cache_depth -= 1
+        if recorder.cache_depth == 0:
+            if value is _missing:
+                recorder.cache_misses += 1
+            else:
+                recorder.cache_hits += 1
+        return default if value is _missing else value
+
+    wrapper.metrics_wrapped = True
+    cache_class.get = wrapper
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or "unnamed"
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if settings.METRICS_SAMPLE_RATE <= 0:
+            return
+        if settings.METRICS_TEMPLATES:
+            _wrap_template_render()
+        if settings.METRICS_CACHES:
+            for alias in settings.CACHES:
+                cache = caches[alias]
+                _wrap_cache_get(type(cache))
+                shared = getattr(cache, "shared", None)
+                if shared is not None:
+                    _wrap_cache_get(type(shared))
+
+    def __call__(self, request):
+        rate = settings.METRICS_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+        recorder = Recorder()
+        _local.recorder = recorder
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _local.recorder = None
+        registry.record(
+            view_name(request), time.perf_counter() - start, recorder
+        )
+        return response
+
+
+def metrics(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4"
+    )
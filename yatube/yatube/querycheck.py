@@ -0,0 +1,173 @@
+"""Development and CI checks for repeated and slow queries.
+
+Queries are grouped by SQL shape, with literal values and IN lists
+collapsed. Each group remembers where its queries came from: the
+template line being rendered, or else the innermost frame of project
+code. A shape repeated QUERY_INSPECTOR_REPEAT_THRESHOLD times in one
+request usually means an N+1 loop. Such repeats and slow queries are
+logged as warnings; with QUERY_INSPECTOR_RAISE set, for example in CI,
+repeats are raised as QueryProblem instead.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+SITE_PACKAGES = ("site-packages", "dist-packages")
+
+
+class QueryProblem(Exception):
+    pass
+
+
+def shape(sql):
+    sql = STRING.sub("?", sql)
+    sql = NUMBER.sub("?", sql.replace("%s", "?"))
+    sql = IN_LIST.sub("(...)", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+def _is_project_file(filename):
+    return (
+        filename.startswith(settings.BASE_DIR)
+        and filename != __file__
+        and not any(part in filename for part in SITE_PACKAGES)
+    )
+
+
+def query_origin():
+    frame = sys._getframe(1)
+    code_origin = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == "render_annotated":
+            node = frame.f_locals.get("self")
+            token = getattr(node, "token", None)
+            origin = getattr(node, "origin", None)
+            if token is not None and origin is not None:
+                name = origin.template_name or origin.name
+                return "%s:%s" % (name, token.lineno)
+        if code_origin is None and _is_project_file(code.co_filename):
+            code_origin = "%s:%s in %s" % (
+                os.path.relpath(code.co_filename, settings.BASE_DIR),
+                frame.f_lineno, code.co_name,
+            )
+        frame = frame.f_back
+    return code_origin or "unknown"
+
+
+class QueryGroup:
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.duration = 0.0
+        self.origins = Counter()
+
+
+class QueryCollector:
+    def __init__(self):
+        self.groups = {}
+        self.slow = []
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            origin = query_origin()
+            key = shape(sql)
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = QueryGroup(key)
+            group.count += 1
+            group.duration += duration
+            group.origins[origin] += 1
+            self.count += 1
+            if duration * 1000 >= settings.QUERY_INSPECTOR_SLOW_MS:
+                self.slow.append((duration, key, origin))
+
+    @contextmanager
+    def capture(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold=None):
+        if threshold is None:
+            threshold = settings.QUERY_INSPECTOR_REPEAT_THRESHOLD
+        ignored = settings.QUERY_INSPECTOR_IGNORE
+        return sorted(
+            (group for group in self.groups.values()
+             if group.count >= threshold
+             and not any(part in group.sql for part in ignored)),
+            key=lambda group: -group.count,
+        )
+
+    def problems(self, threshold=None):
+        messages = []
+        for group in self.repeated(threshold):
+            origins = ", ".join(
+                "%s (%s)" % item for item in group.origins.most_common(3)
+            )
+            messages.append("%s identical queries from %s: %s" % (
+                group.count, origins, group.sql
+            ))
+        for duration, sql, origin in self.slow:
+            messages.append("slow query (%.0f ms) from %s: %s" % (
+                duration * 1000, origin, sql
+            ))
+        return messages
+
+
+class QueryInspectorMiddleware:
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        with collector.capture():
+            response = self.get_response(request)
+        problems = collector.problems()
+        if problems:
+            message = "%s %s: %s" % (
+                request.method, request.path, "; ".join(problems)
+            )
+            # Slow queries depend on the machine, so only repeats fail.
+            if settings.QUERY_INSPECTOR_RAISE and collector.repeated():
+                raise QueryProblem(message)
+            logger.warning(message)
+        return response
+
+
+class QueryBudgetMixin:
+    """TestCase mixin to keep a block under a query budget."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, repeat_threshold=None):
+        collector = QueryCollector()
+        with collector.capture():
+            yield collector
+        problems = collector.repeated(repeat_threshold)
+        if collector.count > budget or problems:
+            self.fail("%s queries executed, budget is %s\n%s" % (
+                collector.count, budget,
+                "\n".join(collector.problems(repeat_threshold)),
+            ))
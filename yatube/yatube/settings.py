@@ -26,7 +26,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = [
         "*",
@@ -54,11 +54,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.metrics.MetricsMiddleware',
+    'yatube.querycheck.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yatube.db.DatabaseMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -68,12 +71,84 @@ INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Metrics: share of requests to profile and how many seconds to keep.
+# Template and cache timings patch Django classes; set METRICS_TEMPLATES=0
+# or METRICS_CACHES=0 to leave them alone.
+
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', 600))
+METRICS_TEMPLATES = os.getenv('METRICS_TEMPLATES', '1') == '1'
+METRICS_CACHES = os.getenv('METRICS_CACHES', '1') == '1'
+
+# Query inspector: warn about repeated (N+1) and slow queries in DEBUG,
+# or fail the request with QUERY_INSPECTOR_RAISE=1, e.g. in CI.
+
+QUERY_INSPECTOR_ENABLED = os.getenv(
+    'QUERY_INSPECTOR', '1' if DEBUG else ''
+) == '1'
+QUERY_INSPECTOR_RAISE = os.getenv('QUERY_INSPECTOR_RAISE', '') == '1'
+QUERY_INSPECTOR_REPEAT_THRESHOLD = 5
+QUERY_INSPECTOR_SLOW_MS = 100
+# sorl-thumbnail looks up its key-value store one key at a time by design
+QUERY_INSPECTOR_IGNORE = ['"thumbnail_kvstore"']
+
+# Cache
+# CACHE_BACKEND selects the shared store: locmem (default), file, memcached
+# or redis (needs django-redis). CACHE_LOCAL_TIER puts a small in-process
+# LRU in front of it, kept coherent across workers by yatube.cache_backends.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+    'redis': 'django_redis.cache.RedisCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_LOCATION = os.getenv('CACHE_LOCATION') or {
+    'locmem': 'yatube',
+    'file': os.path.join(BASE_DIR, 'cache'),
+    'memcached': '127.0.0.1:11211',
+    'redis': 'redis://127.0.0.1:6379/1',
+}[CACHE_BACKEND]
+CACHE_LOCAL_TIER = os.getenv('CACHE_LOCAL_TIER', '') == '1'
+
+
+def cache_alias(prefix, timeout=300):
+    shared = {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': CACHE_LOCATION,
+        'KEY_PREFIX': prefix,
+        'TIMEOUT': timeout,
+    }
+    if not CACHE_LOCAL_TIER:
+        return shared
+    return {
+        'BACKEND': 'yatube.cache_backends.TwoTierCache',
+        'LOCATION': prefix,
+        'KEY_PREFIX': prefix,
+        'TIMEOUT': timeout,
+        'OPTIONS': {
+            'SHARED': shared,
+            'LOCAL_MAX_ENTRIES': int(
+                os.getenv('CACHE_LOCAL_MAX_ENTRIES', 1000)
+            ),
+            'LOCAL_TIMEOUT': float(os.getenv('CACHE_LOCAL_TIMEOUT', 5)),
+        },
     }
+
+
+CACHES = {
+    'default': cache_alias('default'),
+    'page': cache_alias('page', 600),
+    'fragment': cache_alias('fragment', 3600),
+    'session': cache_alias('session', 1209600),
 }
 
+SESSION_ENGINE = os.getenv(
+    'SESSION_ENGINE', 'django.contrib.sessions.backends.db'
+)
+SESSION_CACHE_ALIAS = 'session'
+
 ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
@@ -92,6 +167,16 @@ TEMPLATES = [
         },
     },
 ]
+if not DEBUG:
+    # Compile templates once per process and keep them; run with DEBUG=0
+    # in production.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
@@ -99,12 +184,66 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# DB_ENGINE is sqlite3 (default), postgresql or mysql. DB_REPLICAS is a
+# comma-separated list of read replicas: file names for SQLite, hosts for
+# the others. Replicas serve the read-only views in REPLICA_VIEWS.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite3')
+
+
+def database(name, host=''):
+    if DB_ENGINE == 'sqlite3':
+        engine = 'yatube.backends.sqlite3'
+    else:
+        engine = 'django.db.backends.' + DB_ENGINE
+    return {
+        'ENGINE': engine,
+        'NAME': name,
+        'USER': os.getenv('DB_USER', ''),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.getenv('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     }
+
+
+DATABASES = {
+    'default': database(
+        os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        os.getenv('DB_HOST', ''),
+    ),
 }
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    alias = 'replica%s' % number
+    if DB_ENGINE == 'sqlite3':
+        DATABASES[alias] = database(replica)
+    else:
+        DATABASES[alias] = database(DATABASES['default']['NAME'], replica)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['yatube.db.PrimaryReplicaRouter']
+DATABASE_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', '1') == '1'
+REPLICA_VIEWS = [
+    'index', 'group_posts', 'profile', 'post', 'post_comments',
+    'follow_index', 'popular',
+]
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
+# SQLite: pragmas for every connection, and how often run_write retries a
+# write that found the database locked (backoff doubles from the base).
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,
+    'busy_timeout': 5000,
+}
+SQLITE_WRITE_ATTEMPTS = 5
+SQLITE_WRITE_BACKOFF = 0.05
 
 
 # Password validation
@@ -160,3 +299,53 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
+# post image uploads, see posts.uploads.limited_image_uploads
+
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+# conditional GET: how long a shared cache may keep anonymous pages
+
+HTML_SHARED_MAX_AGE = 60
+
+# comments: shown per post page, and per chunk loaded on scroll
+
+COMMENTS_PER_PAGE = 50
+
+# thumbnails
+
+THUMBNAIL_ASYNC = True
+
+# notifications: followers written per batch on fan-out, how long unread
+# counts stay cached, and how many posts a digest email lists
+
+NOTIFICATION_BATCH_SIZE = 1000
+NOTIFICATION_UNREAD_TIMEOUT = 300
+NOTIFICATION_DIGEST_MAX_POSTS = 20
+
+# task queue: follow-up work of writes runs in the run_tasks worker;
+# eager mode runs it inline (the default with DEBUG, and in tests)
+
+TASKS_EAGER = os.getenv('TASKS_EAGER', '1' if DEBUG else '') == '1'
+TASKS_MAX_ATTEMPTS = 3
+TASKS_RETRY_BACKOFF = 10
+TASKS_LOCK_TIMEOUT = 600
+
+# search: auto uses SQLite FTS5 when available, otherwise "python"
+
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+
+# follow feed
+
+FOLLOW_TIMELINE_ENABLED = True
+FOLLOW_TIMELINE_FANOUT_LIMIT = 1000
+
+# popular feed: an event's weight halves every TRENDING_HALF_LIFE
+# seconds; compact_trending drops scores below TRENDING_MIN_SCORE
+
+TRENDING_HALF_LIFE = 6 * 60 * 60
+TRENDING_COMMENT_WEIGHT = 1.0
+TRENDING_FOLLOW_WEIGHT = 3.0
+TRENDING_MIN_SCORE = 0.01
+TRENDING_CACHE_TIMEOUT = 30
+
@@ -20,11 +20,14 @@ from django.conf.urls import handler404, handler500 # noqa
 from django.conf.urls.static import static
 from django.conf import settings
 
+from . import metrics
+
 urlpatterns = [
     path("auth/", include('users.urls')),
     path('about/', include('django.contrib.flatpages.urls')),
     path("admin/", admin.site.urls),
     path("auth/", include("django.contrib.auth.urls")),
+    path("metrics", metrics.metrics, name="metrics"),
 ]
 
 urlpatterns += [
@@ -35,6 +38,7 @@ urlpatterns += [
 ]
 
 urlpatterns += [
+    path("api/v1/", include("posts.api_urls")),
     path("", include("posts.urls")),
 ]
 